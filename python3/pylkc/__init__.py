@@ -33,9 +33,15 @@ __version__ = "0.0.1"
 
 import os
 import re
+import array
+import bisect
 import ctypes
+import fnmatch
+import threading
 import subprocess
 import builtins
+import tempfile
+import contextlib
 from . import api
 from pylkcx import path
 
@@ -48,12 +54,19 @@ class tristate:
 
 class menu:
 
-    def __init__(self, c_menu_p):
+    __slots__ = ("c_menu_p", "_addr")
+
+    def __new__(cls, c_menu_p):
         assert c_menu_p and isinstance(c_menu_p, ctypes.POINTER(api.struct_menu))
-        self.c_menu_p = c_menu_p
+        return _intern(cls, c_menu_p, ctypes.addressof(c_menu_p.contents))
 
     @property
     def list(self):
+        if _menu_tree is not None:
+            i = _menu_tree.index_dict.get(self)
+            if i is not None:
+                return builtins.list(_menu_tree.children_list[i])
+
         ret = []
         p_menu = self.c_menu_p.contents.list
         while p_menu:
@@ -104,17 +117,19 @@ class menu:
         return api.library.menu_get_help(self.c_menu_p).decode("utf_8")
 
     def __eq__(self, other):
-        return ctypes.addressof(self.c_menu_p.contents) == ctypes.addressof(other.c_menu_p.contents)
+        return self._addr == other._addr
 
     def __ne__(self, other):
-        return ctypes.addressof(self.c_menu_p.contents) != ctypes.addressof(other.c_menu_p.contents)
+        return self._addr != other._addr
 
     def __hash__(self):
-        return ctypes.addressof(self.c_menu_p.contents)
+        return self._addr
 
 
 class symbol:
 
+    __slots__ = ("c_symbol_p", "_addr")
+
     TYPE_UNKNOWN = 0
     TYPE_BOOLEAN = 1
     TYPE_TRISTATE = 2
@@ -123,9 +138,9 @@ class symbol:
     TYPE_STRING = 5
     TYPE_OTHER = 6
 
-    def __init__(self, c_symbol_p):
+    def __new__(cls, c_symbol_p):
         assert c_symbol_p and isinstance(c_symbol_p, ctypes.POINTER(api.struct_symbol))
-        self.c_symbol_p = c_symbol_p
+        return _intern(cls, c_symbol_p, ctypes.addressof(c_symbol_p.contents))
 
     @property
     def name(self):
@@ -137,12 +152,14 @@ class symbol:
     @property
     def dir_dep(self):
         # corresponds to the "Depends on" field
-        return expr_value(ctypes.pointer(self.c_symbol_p.contents.dir_dep))
+        ret = _object_cache[expr_value].get(self._addr + api.struct_symbol.dir_dep.offset)
+        return ret if ret is not None else expr_value(ctypes.pointer(self.c_symbol_p.contents.dir_dep))
 
     @property
     def rev_dep(self):
         # corresponds to the "Selected by" field
-        return expr_value(ctypes.pointer(self.c_symbol_p.contents.rev_dep))
+        ret = _object_cache[expr_value].get(self._addr + api.struct_symbol.rev_dep.offset)
+        return ret if ret is not None else expr_value(ctypes.pointer(self.c_symbol_p.contents.rev_dep))
 
     @property
     def visible(self):
@@ -218,17 +235,19 @@ class symbol:
         return ret
 
     def __eq__(self, other):
-        return ctypes.addressof(self.c_symbol_p.contents) == ctypes.addressof(other.c_symbol_p.contents)
+        return self._addr == other._addr
 
     def __ne__(self, other):
-        return ctypes.addressof(self.c_symbol_p.contents) != ctypes.addressof(other.c_symbol_p.contents)
+        return self._addr != other._addr
 
     def __hash__(self):
-        return ctypes.addressof(self.c_symbol_p.contents)
+        return self._addr
 
 
 class property:
 
+    __slots__ = ("c_property_p", "_addr")
+
     TYPE_UNKNOWN = 0
     TYPE_PROMPT = 1
     TYPE_COMMENT = 2
@@ -240,9 +259,9 @@ class property:
     TYPE_RANGE = 8
     TYPE_SYMBOL = 9
 
-    def __init__(self, c_property_p):
+    def __new__(cls, c_property_p):
         assert c_property_p and isinstance(c_property_p, ctypes.POINTER(api.struct_property))
-        self.c_property_p = c_property_p
+        return _intern(cls, c_property_p, ctypes.addressof(c_property_p.contents))
 
     @builtins.property
     def type(self):
@@ -252,23 +271,31 @@ class property:
     def expr(self):
         return expr(self.c_property_p.contents.expr)
 
+    @builtins.property
+    def visible(self):
+        # corresponds to the "if" condition
+        ret = _object_cache[expr_value].get(self._addr + api.struct_property.visible.offset)
+        return ret if ret is not None else expr_value(ctypes.pointer(self.c_property_p.contents.visible))
+
     def get_symbol(self):
         """An obscure interface, please check the use case in kernel source for detail"""
         ret = api.library.prop_get_symbol(self.c_property_p)
         return symbol(ret) if ret else None
 
     def __eq__(self, other):
-        return ctypes.addressof(self.c_property_p.contents) == ctypes.addressof(other.c_property_p.contents)
+        return self._addr == other._addr
 
     def __ne__(self, other):
-        return ctypes.addressof(self.c_property_p.contents) != ctypes.addressof(other.c_property_p.contents)
+        return self._addr != other._addr
 
     def __hash__(self):
-        return ctypes.addressof(self.c_property_p.contents)
+        return self._addr
 
 
 class expr:
 
+    __slots__ = ("c_expr_p", "_addr")
+
     TYPE_NONE = 0
     TYPE_OR = 1
     TYPE_AND = 2
@@ -283,7 +310,7 @@ class expr:
     TYPE_SYMBOL = 11
     TYPE_RANGE = 12
 
-    def __init__(self, c_expr_p):
+    def __new__(cls, c_expr_p):
         """c_expr_p can be NULL!
            expr object with a NULL pointer has the following features:
              1. always evaluates to yes
@@ -291,7 +318,7 @@ class expr:
              3. left == None
              4. right == None"""
         assert not c_expr_p or isinstance(c_expr_p, ctypes.POINTER(api.struct_expr))
-        self.c_expr_p = c_expr_p
+        return _intern(cls, c_expr_p, ctypes.addressof(c_expr_p.contents) if c_expr_p else 0)
 
     @builtins.property
     def type(self):
@@ -386,17 +413,19 @@ class expr:
         return int(api.library.expr_calc_value(self.c_expr_p))
 
     def __eq__(self, other):
-        return ctypes.addressof(self.c_expr_p.contents) == ctypes.addressof(other.c_expr_p.contents)
+        return self._addr == other._addr
 
     def __ne__(self, other):
-        return ctypes.addressof(self.c_expr_p.contents) != ctypes.addressof(other.c_expr_p.contents)
+        return self._addr != other._addr
 
     def __hash__(self):
-        return ctypes.addressof(self.c_expr_p.contents)
+        return self._addr
 
 
 class expr_data:
 
+    __slots__ = ("c_expr_data_p", "expr_or_sym")
+
     def __init__(self, c_expr_data_p, expr_or_sym):
         assert c_expr_data_p and isinstance(c_expr_data_p, ctypes.POINTER(api.union_expr_data))
         assert isinstance(expr_or_sym, bool)
@@ -416,9 +445,11 @@ class expr_data:
 
 class expr_value:
 
-    def __init__(self, c_expr_value_p):
+    __slots__ = ("c_expr_value_p", "_addr")
+
+    def __new__(cls, c_expr_value_p):
         assert c_expr_value_p and isinstance(c_expr_value_p, ctypes.POINTER(api.struct_expr_value))
-        self.c_expr_value_p = c_expr_value_p
+        return _intern(cls, c_expr_value_p, ctypes.addressof(c_expr_value_p.contents))
 
     @builtins.property
     def expr(self):
@@ -432,70 +463,188 @@ class expr_value:
         return int(self.c_expr_value_p.contents.tri)
 
     def __eq__(self, other):
-        return ctypes.addressof(self.c_expr_value_p.contents) == ctypes.addressof(other.c_expr_value_p.contents)
+        return self._addr == other._addr
 
     def __ne__(self, other):
-        return ctypes.addressof(self.c_expr_value_p.contents) != ctypes.addressof(other.c_expr_value_p.contents)
+        return self._addr != other._addr
 
     def __hash__(self):
-        return ctypes.addressof(self.c_expr_value_p.contents)
+        return self._addr
+
+
+class value_snapshot:
+    """Saved value state (curr, def, visible, flags) of all the symbols, see snapshot() and restore()"""
+
+    def __init__(self, c_snapshot_p):
+        assert c_snapshot_p
+        self.c_snapshot_p = c_snapshot_p
+        self._library = api.library
+
+    def __del__(self):
+        self._library.pylkc_snapshot_free(self.c_snapshot_p)
+
+
+class symbol_values:
+    """Values of all the symbols read in one call by read_values().
+       The fields are parallel arrays indexed by the symbol id, see sym_id()."""
+
+    def __init__(self, count):
+        self.type = array.array("B", [0]) * count            # value of symbol.get_type()
+        self.tri = array.array("B", [0]) * count             # value of symbol.get_tristate_value()
+        self.visible = array.array("B", [0]) * count         # value of symbol.visible
+        self.rev_dep_tri = array.array("B", [0]) * count     # value of symbol.rev_dep.tri
+        self.flags = array.array("i", [0]) * count           # value of struct symbol.flags
+
+    def __len__(self):
+        return len(self.type)
+
+    def changed_ids(self, other):
+        """Returns the sorted ids of the symbols whose type, tristate value, visibility or rev_dep
+           tristate differs in the two readouts. String values are not compared."""
+        assert len(self) == len(other)
+        ret = set()
+        for a, b in [(self.type, other.type), (self.tri, other.tri), (self.visible, other.visible), (self.rev_dep_tri, other.rev_dep_tri)]:
+            if a != b:
+                ret.update(i for i in range(0, len(a)) if a[i] != b[i])
+        return sorted(ret)
+
+    def to_numpy(self):
+        """Returns a NumPy structured array, needs NumPy to be installed"""
+        import numpy
+        ret = numpy.empty(len(self), dtype=[("type", "u1"), ("tri", "u1"), ("visible", "u1"), ("rev_dep_tri", "u1"), ("flags", "i4")])
+        ret["type"] = self.type
+        ret["tri"] = self.tri
+        ret["visible"] = self.visible
+        ret["rev_dep_tri"] = self.rev_dep_tri
+        ret["flags"] = self.flags
+        return ret
 
 
 class VersionError(Exception):
     pass
 
 
-def init(kernel_src_path):
+class Session:
+    """A kconfig tree with its own copy of the lkc library and its own environment variables.
+
+       Several sessions can be kept in one process. The module level functions (conf_parse(),
+       conf_read(), sym_find(), ...) operate on the session activated by the with statement.
+       Objects got from one session must not be used when another session is active."""
+
+    def __init__(self, kernel_src_path, arch=None, build_dir=None):
+        self.kernel_src_path = kernel_src_path
+        self._state = {
+            "rootmenu": None,
+            "_all_symbols_list": [],
+            "_all_symbols_array": None,
+            "_sym_id_dict": dict(),
+            "_menu_tree": None,
+            "_sym_name_index": None,
+            "_parse_cache": dict(),
+            "_object_cache": _new_object_cache(),
+            "_sym_menu_dict": dict(),
+            "_kver_int": _get_kver_int(kernel_src_path),
+        }
+        if self._state["_kver_int"] < _kver_str_to_int("3.16"):
+            raise VersionError("pylkc only supports kernel 3.16 and later")
+
+        self._library = api.load_library(kernel_src_path, build_dir)
+        self._library.conf_set_message_callback(None)            # disable all message output
+
+        self.environ = _get_environ(kernel_src_path, arch)
+        self._savedList = []
+
+    def conf_parse(self):
+        with self:
+            conf_parse(self.kernel_src_path)
+
+    def close(self):
+        assert len(self._savedList) == 0
+        self._state = None
+        api.unload_library(self._library)
+        self._library = None
+
+    def __enter__(self):
+        assert self._library is not None
+        _session_lock.acquire()
+
+        g = globals()
+        self._savedList.append(({k: g[k] for k in self._state}, api.library, {k: os.environ.get(k) for k in self.environ}))
+        g.update(self._state)
+        api.library = self._library
+        os.environ.update(self.environ)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        g = globals()
+        savedState, savedLibrary, savedEnviron = self._savedList.pop()
+        self._state = {k: g[k] for k in self._state}
+        g.update(savedState)
+        api.library = savedLibrary
+        for k, v in savedEnviron.items():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+
+        _session_lock.release()
+
+
+def init(kernel_src_path, build_dir=None):
+    """build_dir is where the shared object and the other generated files are put, see api.init_library()"""
+
     global rootmenu
     global _all_symbols_list
+    global _all_symbols_array
+    global _sym_id_dict
     global _sym_menu_dict
+    global _menu_tree
+    global _sym_name_index
+    global _parse_cache
+    global _object_cache
     global _kver_int
 
     _kver_int = _get_kver_int(kernel_src_path)
     if _kver_int_less_than("3.16"):
         raise VersionError("pylkc only supports kernel 3.16 and later")
 
-    api.init_library(kernel_src_path)
+    api.init_library(kernel_src_path, build_dir)
 
     # disable all message output
     api.library.conf_set_message_callback(None)
 
-    # use the same algorithm as the linux kernel root Makefile
-    if "ARCH" not in os.environ:
-        os.environ["ARCH"] = _get_sub_arch()
-    os.environ["SRCARCH"] = os.environ["ARCH"]
-    if os.environ["ARCH"] == "i386":
-        os.environ["SRCARCH"] = "x86"
-    if os.environ["ARCH"] == "x86_64":
-        os.environ["SRCARCH"] = "x86"
-    if os.environ["ARCH"] == "sparc32":
-        os.environ["SRCARCH"] = "sparc"
-    if os.environ["ARCH"] == "sparc64":
-        os.environ["SRCARCH"] = "sparc"
-    if os.environ["ARCH"] == "sh64":
-        os.environ["SRCARCH"] = "sh"
-    if os.environ["ARCH"] == "tilepro":
-        os.environ["SRCARCH"] = "tile"
-    if os.environ["ARCH"] == "tilegx":
-        os.environ["SRCARCH"] = "tile"
-    os.environ["KERNELVERSION"] = _get_kernel_version(kernel_src_path)
-    os.environ["srctree"] = kernel_src_path
-    os.environ["CC"] = "gcc"
-    os.environ["RUSTC"] = "rustc"
-    os.environ["LD"] = "ld"
+    os.environ.update(_get_environ(kernel_src_path))
 
     _all_symbols_list = []
+    _all_symbols_array = None
+    _sym_id_dict = dict()
     _sym_menu_dict = dict()
+    _menu_tree = None
+    _sym_name_index = None
+    _parse_cache = dict()
+    _object_cache = _new_object_cache()
 
 
 def release():
     global rootmenu
     global _all_symbols_list
+    global _all_symbols_array
+    global _sym_id_dict
     global _sym_menu_dict
+    global _menu_tree
+    global _sym_name_index
+    global _parse_cache
+    global _object_cache
     global _kver_int
 
     _kver_int = None
+    _object_cache = None
+    _parse_cache = None
+    _sym_name_index = None
+    _menu_tree = None
     _sym_menu_dict = None
+    _sym_id_dict = None
+    _all_symbols_array = None
     _all_symbols_list = None
     rootmenu = None
     api.fini_library()
@@ -504,7 +653,11 @@ def release():
 def conf_parse(kernel_src_path):
     global rootmenu
     global _all_symbols_list
+    global _all_symbols_array
+    global _sym_id_dict
     global _sym_menu_dict
+    global _menu_tree
+    global _sym_name_index
 
     curdir = os.getcwd()
     os.chdir(kernel_src_path)
@@ -512,7 +665,11 @@ def conf_parse(kernel_src_path):
         api.library.conf_parse(ctypes.c_char_p(os.path.join(kernel_src_path, "Kconfig").encode("utf_8")))
         rootmenu = menu(api.library.menu_get_root_menu(None))
         _generate_all_symbols_list(_all_symbols_list)
-        _generate_sym_menu_dict(rootmenu, _sym_menu_dict)
+        _all_symbols_array = _generate_all_symbols_array(_all_symbols_list)
+        _generate_sym_id_dict(_all_symbols_list, _sym_id_dict)
+        _sym_name_index = _symbol_name_index(_all_symbols_list)
+        _menu_tree = _generate_menu_tree(rootmenu)
+        _generate_sym_menu_dict(_menu_tree, _sym_menu_dict)
     finally:
         os.chdir(curdir)
 
@@ -531,42 +688,174 @@ def conf_write(filename):
         api.library.conf_write(ctypes.c_char_p(filename))
 
 
+def conf_read_bytes(buf):
+    """Same as conf_read(), but reads the config from buf instead of a file"""
+    with _memory_file() as (f, filename):
+        f.write(buf)
+        f.flush()
+        conf_read(filename)
+
+
+def conf_write_bytes():
+    """Same as conf_write(), but returns the config as bytes instead of writing a file"""
+    with _memory_file() as (f, filename):
+        # conf_write() writes a temporary file in the same directory and renames it, which is not possible in /proc/self/fd
+        oldValue = os.environ.get("KCONFIG_OVERWRITECONFIG")
+        os.environ["KCONFIG_OVERWRITECONFIG"] = "1"
+        try:
+            conf_write(filename)
+        finally:
+            if oldValue is None:
+                del os.environ["KCONFIG_OVERWRITECONFIG"]
+            else:
+                os.environ["KCONFIG_OVERWRITECONFIG"] = oldValue
+        f.seek(0)
+        return f.read()
+
+
+def conf_write_min(filename):
+    """Writes only the symbols whose values are not their defaults, same as "make savedefconfig".
+       conf_expand_min() turns the file back into the full config. Raises OSError if the file can't be written."""
+    if api.library.conf_write_defconfig(ctypes.c_char_p(filename.encode("utf_8"))) != 0:
+        raise OSError("failed to write \"%s\"" % (filename))
+
+
+def conf_expand_min(min_filename, filename):
+    """Reads a file written by conf_write_min() and writes the full config to filename, same as "make defconfig".
+       The value state of all the symbols is changed."""
+    conf_read(min_filename)
+    calc_all()
+    conf_write(filename)
+
+
+def snapshot():
+    """Save the value state of all the symbols in one call.
+       Restoring it is much cheaper than conf_read() followed by calc_value() on all the symbols."""
+    ret = api.library.pylkc_snapshot_new()
+    if not ret:
+        raise MemoryError()
+    return value_snapshot(ret)
+
+
+def restore(snap):
+    assert snap._library is api.library
+    api.library.pylkc_snapshot_restore(snap.c_snapshot_p)
+
+
 def all_symbols():
     global _all_symbols_list
     return _all_symbols_list
 
 
+def calc_all(only_invalid=False):
+    """Same as "for sym in all_symbols(): sym.calc_value()", but done in one call.
+       If only_invalid is True, sym_calc_value() is called only on the symbols whose SYMBOL_VALID flag is cleared.
+       Returns the number of symbols on which sym_calc_value() is called."""
+    return api.library.pylkc_calc_all(1 if only_invalid else 0)
+
+
+def sym_id(sym_obj):
+    """Returns the stable id of a symbol, which is its index in all_symbols()"""
+    global _sym_id_dict
+    return _sym_id_dict[sym_obj]
+
+
+def read_values():
+    """Read the type, tristate value, visibility, rev_dep tristate and flags of all the symbols in one call.
+       Returns a symbol_values object."""
+    global _all_symbols_array
+
+    ret = symbol_values(len(_all_symbols_array))
+    api.library.pylkc_read_values(_all_symbols_array, len(_all_symbols_array),
+                                  _as_c_array(ctypes.c_ubyte, ret.type), _as_c_array(ctypes.c_ubyte, ret.tri),
+                                  _as_c_array(ctypes.c_ubyte, ret.visible), _as_c_array(ctypes.c_ubyte, ret.rev_dep_tri),
+                                  _as_c_array(ctypes.c_int, ret.flags))
+    return ret
+
+
+def read_string_values():
+    """Read the string values of all the int, hex and string symbols in one call.
+       Returns a list indexed by the symbol id, the other symbols have empty strings."""
+    global _all_symbols_array
+
+    count = len(_all_symbols_array)
+    size = api.library.pylkc_read_strings(_all_symbols_array, count, None, 0)
+    buf = ctypes.create_string_buffer(size)
+    ret = api.library.pylkc_read_strings(_all_symbols_array, count, buf, size)
+    assert ret == size
+    return buf.raw.decode("utf_8").split("\0")[:count]
+
+
 def sym_lookup(symbol_name, flags):
     assert False
 
 
 def sym_find(symbol_name):
+    global _all_symbols_list
+    global _sym_name_index
+
+    if _sym_name_index is not None:
+        i = _sym_name_index.name_dict.get(symbol_name)
+        if i is not None:
+            return _all_symbols_list[i]
     ret = api.library.sym_find(ctypes.c_char_p(symbol_name.encode("utf_8")))
     return symbol(ret) if ret else None
 
 
+def sym_search_prefix(prefix):
+    """Returns the ids of the symbols whose name starts with prefix, in name order"""
+    global _sym_name_index
+    return _sym_name_index.search_prefix(prefix)
+
+
+def sym_search_glob(pattern):
+    """Returns the ids of the symbols whose name matches the shell-style pattern (case-sensitive), in name order"""
+    global _sym_name_index
+    return _sym_name_index.search_glob(pattern)
+
+
+def sym_search_regex(pattern):
+    """Returns the ids of the symbols whose name matches the regular expression by re.match(), in name order"""
+    global _sym_name_index
+    return _sym_name_index.search_regex(pattern)
+
+
 def menu_find_by_path(menu_path, fuzzy=False):
-    global rootmenu
+    global _menu_tree
     assert path.isabs(menu_path)
 
-    curitem = rootmenu
+    i = 0                                           # root menu
     for p in path._full_split(menu_path)[1:]:
-        found = None
-        for m in curitem.list:
-            if m.get_prompt() is not None:
-                if fuzzy:
-                    if path.compare_fuzzy(path.escape(m.get_prompt()), p):
-                        found = m
-                        break
-                else:
-                    if path.compare(path.escape(m.get_prompt()), p):
-                        found = m
-                        break
-        if found is not None:
-            curitem = found
-        else:
+        i = _menu_tree.find_child(i, p, fuzzy)
+        if i is None:
             return None
-    return curitem
+    return _menu_tree.menu_list[i]
+
+
+def menu_id(menu_obj):
+    """Returns the stable id of a menu, which is its index in all_menus()"""
+    global _menu_tree
+    return _menu_tree.index_dict[menu_obj]
+
+
+def menu_get_path(menu_obj):
+    """Returns the absolute path of menu_obj, which can be used by menu_find_by_path().
+       Returns None if menu_obj or any of its parent menus has no prompt."""
+    global _menu_tree
+    return _menu_tree.get_path(_menu_tree.index_dict[menu_obj])
+
+
+def all_menus():
+    """Returns all the menus in pre-order"""
+    global _menu_tree
+    return _menu_tree.menu_list
+
+
+def menu_subtree(menu_obj):
+    """Returns menu_obj and all the menus under it in pre-order"""
+    global _menu_tree
+    i = _menu_tree.index_dict[menu_obj]
+    return _menu_tree.menu_list[i:_menu_tree.subtree_end_list[i]]
 
 
 def menu_find_by_sym(sym_obj):
@@ -574,6 +863,20 @@ def menu_find_by_sym(sym_obj):
     return _sym_menu_dict.get(sym_obj, None)
 
 
+def parsed_files():
+    """Returns the absolute paths of the kconfig files read by conf_parse(), in the order they are read"""
+    if api.library.g_file_list is None:
+        raise VersionError("the list of parsed files is not available in this kernel")
+
+    ret = []
+    p_file = api.library.g_file_list
+    while p_file:
+        ret.append(os.path.normpath(os.path.join(os.environ["srctree"], p_file.contents.name.decode("utf_8"))))
+        p_file = p_file.contents.next
+    ret.reverse()                       # file_lookup() adds new file to the head of the list
+    return ret
+
+
 rootmenu = None
 
 
@@ -581,8 +884,221 @@ rootmenu = None
 
 
 _all_symbols_list = None
+_all_symbols_array = None
+_sym_id_dict = None
 _sym_menu_dict = None
+_menu_tree = None
+_sym_name_index = None
+_parse_cache = None             # <module name, data>, data derived from the parsed tree by pylkcx modules
+_object_cache = None            # <class, <address, object>>, so that every C object has only one python object
 _kver_int = None
+_session_lock = threading.RLock()
+
+
+class _symbol_name_index:
+    """Names of all the symbols (constant symbols excluded, same as sym_find()), built after conf_parse()"""
+
+    def __init__(self, symbol_list):
+        self.name_dict = dict()                     # <name, symbol id>
+        for i, sym in enumerate(symbol_list):
+            if sym.name is not None and not (sym.c_symbol_p.contents.flags & api.SYMBOL_CONST):
+                self.name_dict[sym.name] = i
+        self.name_list = sorted(self.name_dict)    # sorted names
+        self.id_list = [self.name_dict[x] for x in self.name_list]
+
+    def search_prefix(self, prefix):
+        start, end = self._prefix_range(prefix)
+        return self.id_list[start:end]
+
+    def search_glob(self, pattern):
+        # only the names starting with the literal head of the pattern need checking
+        start, end = self._prefix_range(re.split("[*?[]", pattern, 1)[0])
+        regex = re.compile(fnmatch.translate(pattern))
+        return [self.id_list[k] for k in range(start, end) if regex.match(self.name_list[k])]
+
+    def search_regex(self, pattern):
+        regex = re.compile(pattern)
+        return [self.id_list[k] for k in range(0, len(self.name_list)) if regex.match(self.name_list[k])]
+
+    def _prefix_range(self, prefix):
+        start = bisect.bisect_left(self.name_list, prefix)
+        end = bisect.bisect_left(self.name_list, prefix + chr(0x10FFFF), start)
+        return (start, end)
+
+
+class _flat_menu_tree:
+    """The menu tree flattened in pre-order after conf_parse(), it never changes after that.
+       Menu i has its subtree in [i, subtree_end_list[i]), its parent is parent_list[i],
+       its first child is first_child_list[i] (-1 for root menu and leaf menu)."""
+
+    def __init__(self):
+        self.menu_list = []
+        self.index_dict = dict()                    # <menu, index>
+        self.parent_list = array.array("i")
+        self.first_child_list = array.array("i")
+        self.subtree_end_list = array.array("i")
+        self.children_list = []                     # tuple of child menus, same as menu.list
+        self._prompt_dict = dict()                  # <index, escaped prompt>, filled on demand
+        self._path_dict = dict()                    # <index, absolute path>, filled on demand
+        self._child_index_dict = dict()             # <index, _menu_child_index>, filled on demand
+
+    def find_child(self, i, path_element, fuzzy):
+        """Returns the index of the first child of menu i whose prompt matches path_element, or None"""
+        index_obj = self._child_index_dict.get(i)
+        if index_obj is None:
+            index_obj = _menu_child_index(self, i)
+            self._child_index_dict[i] = index_obj
+        if fuzzy:
+            return index_obj.find_fuzzy(path_element)
+        else:
+            return index_obj.exact_dict.get(path_element)
+
+    def get_prompt(self, i):
+        if i not in self._prompt_dict:
+            ret = self.menu_list[i].get_prompt()
+            self._prompt_dict[i] = path.escape(ret) if ret is not None else None
+        return self._prompt_dict[i]
+
+    def get_path(self, i):
+        if i not in self._path_dict:
+            if i == 0:
+                ret = "/"
+            else:
+                ret = self.get_path(self.parent_list[i])
+                prompt = self.get_prompt(i)
+                if ret is None or prompt is None:
+                    ret = None
+                elif ret == "/":
+                    ret = "/" + prompt
+                else:
+                    ret = ret + "/" + prompt
+            self._path_dict[i] = ret
+        return self._path_dict[i]
+
+
+class _menu_child_index:
+    """Index of the children of a menu, keyed by escaped prompt. Has the same result as
+       path.compare() and path.compare_fuzzy() on every child, the first matching child wins."""
+
+    def __init__(self, tree_obj, i):
+        self.exact_dict = dict()                    # <escaped prompt, child index>
+        self.fuzzy_dict = dict()                    # <degraded escaped prompt, child index>
+        self.fuzzy_key_list = []                    # sorted degraded escaped prompts, for the path elements with "..."
+        self.fuzzy_index_list = []                  # child index of fuzzy_key_list
+        self.ellipsis_list = []                     # (prefix, suffix, child index) for the prompts with "..."
+
+        j = tree_obj.first_child_list[i]
+        while j != -1 and j < tree_obj.subtree_end_list[i]:
+            prompt = tree_obj.get_prompt(j)
+            if prompt is not None:
+                key = path._degrade(prompt)
+                self.exact_dict.setdefault(prompt, j)
+                self.fuzzy_dict.setdefault(key, j)
+                self.fuzzy_key_list.append((key, j))
+                if "..." in key:
+                    t = key.split("...", 1)
+                    self.ellipsis_list.append((t[0], t[1], j))
+            j = tree_obj.subtree_end_list[j]
+
+        self.fuzzy_key_list.sort()
+        self.fuzzy_index_list = [x[1] for x in self.fuzzy_key_list]
+        self.fuzzy_key_list = [x[0] for x in self.fuzzy_key_list]
+
+    def find_fuzzy(self, path_element):
+        key = path._degrade(path_element)
+        ret = None
+        if "..." in key:
+            assert key.count("...") <= 1
+            prefix, suffix = key.split("...")
+            k = bisect.bisect_left(self.fuzzy_key_list, prefix)
+            while k < len(self.fuzzy_key_list) and self.fuzzy_key_list[k].startswith(prefix):
+                if self.fuzzy_key_list[k].endswith(suffix):
+                    if ret is None or self.fuzzy_index_list[k] < ret:
+                        ret = self.fuzzy_index_list[k]
+                k += 1
+        else:
+            ret = self.fuzzy_dict.get(key)
+            for prefix, suffix, j in self.ellipsis_list:
+                if ret is not None and j > ret:
+                    continue
+                if key.startswith(prefix) and key.endswith(suffix):
+                    ret = j
+        return ret
+
+
+def _new_object_cache():
+    return {
+        menu: dict(),
+        symbol: dict(),
+        property: dict(),
+        expr: dict(),
+        expr_value: dict(),
+    }
+
+
+def _intern(cls, c_p, addr):
+    global _object_cache
+
+    d = _object_cache[cls]
+    ret = d.get(addr)
+    if ret is None:
+        ret = object.__new__(cls)
+        setattr(ret, cls.__slots__[0], c_p)
+        ret._addr = addr
+        d[addr] = ret
+    return ret
+
+
+@contextlib.contextmanager
+def _memory_file():
+    # returns (file object, filename), the filename can be opened by the lkc library
+    if hasattr(os, "memfd_create"):
+        f = os.fdopen(os.memfd_create("pylkc"), "w+b")
+        try:
+            yield (f, "/proc/self/fd/%d" % (f.fileno()))
+        finally:
+            f.close()
+    else:
+        tmpDir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, filename = tempfile.mkstemp(dir=tmpDir)
+        f = os.fdopen(fd, "w+b")
+        try:
+            yield (f, filename)
+        finally:
+            f.close()
+            os.unlink(filename)
+
+
+def _get_environ(kernel_src_path, arch=None):
+    # use the same algorithm as the linux kernel root Makefile
+    ret = dict()
+    if arch is not None:
+        ret["ARCH"] = arch
+    elif "ARCH" in os.environ:
+        ret["ARCH"] = os.environ["ARCH"]
+    else:
+        ret["ARCH"] = _get_sub_arch()
+    ret["SRCARCH"] = ret["ARCH"]
+    if ret["ARCH"] == "i386":
+        ret["SRCARCH"] = "x86"
+    if ret["ARCH"] == "x86_64":
+        ret["SRCARCH"] = "x86"
+    if ret["ARCH"] == "sparc32":
+        ret["SRCARCH"] = "sparc"
+    if ret["ARCH"] == "sparc64":
+        ret["SRCARCH"] = "sparc"
+    if ret["ARCH"] == "sh64":
+        ret["SRCARCH"] = "sh"
+    if ret["ARCH"] == "tilepro":
+        ret["SRCARCH"] = "tile"
+    if ret["ARCH"] == "tilegx":
+        ret["SRCARCH"] = "tile"
+    ret["KERNELVERSION"] = _get_kernel_version(kernel_src_path)
+    ret["srctree"] = kernel_src_path
+    ret["CC"] = "gcc"
+    ret["RUSTC"] = "rustc"
+    ret["LD"] = "ld"
+    return ret
 
 
 def _get_sub_arch():
@@ -638,15 +1154,17 @@ def _get_kver_int(kernel_src_path):
 
 def _kver_int_less_than(kernel_version):
     global _kver_int
+    return _kver_int < _kver_str_to_int(kernel_version)
+
 
+def _kver_str_to_int(kernel_version):
     vlist = kernel_version.split(".")
     ret = int(vlist[0]) * 100 * 1000
     if len(vlist) > 1:
         ret += int(vlist[1]) * 1000
     if len(vlist) > 2:
         ret += int(vlist[2])
-
-    return _kver_int < ret
+    return ret
 
 
 def _generate_all_symbols_list(list_obj):
@@ -658,8 +1176,49 @@ def _generate_all_symbols_list(list_obj):
             p_sym = p_sym.contents.next
 
 
-def _generate_sym_menu_dict(menu_obj, dict_obj):
-    if menu_obj.sym is not None:
-        dict_obj[menu_obj.sym] = menu_obj
-    for m in menu_obj.list:
-        _generate_sym_menu_dict(m, dict_obj)
+def _generate_all_symbols_array(list_obj):
+    return (ctypes.POINTER(api.struct_symbol) * len(list_obj))(*[x.c_symbol_p for x in list_obj])
+
+
+def _generate_sym_id_dict(list_obj, dict_obj):
+    for i, sym in enumerate(list_obj):
+        dict_obj[sym] = i
+
+
+def _as_c_array(c_type, array_obj):
+    return (c_type * len(array_obj)).from_buffer(array_obj)
+
+
+def _generate_menu_tree(root_menu_obj):
+    ret = _flat_menu_tree()
+    _generate_menu_tree_impl(ret, root_menu_obj, -1)
+    return ret
+
+
+def _generate_menu_tree_impl(tree_obj, menu_obj, parent_index):
+    i = len(tree_obj.menu_list)
+    tree_obj.menu_list.append(menu_obj)
+    tree_obj.index_dict[menu_obj] = i
+    tree_obj.parent_list.append(parent_index)
+    tree_obj.first_child_list.append(-1)
+    tree_obj.subtree_end_list.append(-1)
+    tree_obj.children_list.append(None)
+
+    children = []
+    p_menu = menu_obj.c_menu_p.contents.list
+    while p_menu:
+        m = menu(p_menu)
+        if len(children) == 0:
+            tree_obj.first_child_list[i] = len(tree_obj.menu_list)
+        children.append(m)
+        _generate_menu_tree_impl(tree_obj, m, i)
+        p_menu = p_menu.contents.next
+
+    tree_obj.children_list[i] = tuple(children)
+    tree_obj.subtree_end_list[i] = len(tree_obj.menu_list)
+
+
+def _generate_sym_menu_dict(tree_obj, dict_obj):
+    for m in tree_obj.menu_list:
+        if m.sym is not None:
+            dict_obj[m.sym] = m
@@ -21,29 +21,77 @@
 # THE SOFTWARE.
 
 import os
+import json
 import shutil
+import hashlib
+import tempfile
+import contextlib
 import subprocess
+import threading
+import multiprocessing
+import concurrent.futures
 import ctypes
+import _ctypes
 
 
 library = None
 
 
-def init_library(kernel_src_path):
+def init_library(kernel_src_path, build_dir=None):
+    """All the generated files are put in build_dir, nothing is written into the kernel source tree.
+       build_dir defaults to the cache directory, and can be private or shared by concurrent users."""
+
     global _kernel_src_path
-    global _kcfg_path
-    global _so_file
     global library
 
     assert _kernel_src_path == ""
 
     _kernel_src_path = kernel_src_path
-    _kcfg_path = os.path.join(_kernel_src_path, "scripts", "kconfig")
-    _so_file = os.path.join(_kcfg_path, "pylkc.so")
+    library = load_library(kernel_src_path, build_dir)
+
+
+def fini_library():
+    global _kernel_src_path
+    global library
+
+    assert _kernel_src_path != ""
+
+    unload_library(library)
+    library = None
+
+    _kernel_src_path = ""
 
-    _build_so_file()
 
-    library = ctypes.CDLL(_so_file)
+def load_library(kernel_src_path, build_dir=None):
+    """Returns a newly loaded library object.
+       Every library object has its own copy of the C global variables (symbol_hash, rootmenu, ...),
+       so several of them can be used in one process."""
+
+    kcfgPath = os.path.join(kernel_src_path, "scripts", "kconfig")
+    buildDir = build_dir if build_dir is not None else get_cache_dir()
+    os.makedirs(buildDir, exist_ok=True)
+    soFile = os.path.join(buildDir, "%s.so" % (_get_build_key(kcfgPath, buildDir)))
+
+    # the shared object is content addressed, a warm cache needs no compilation at all
+    if not os.path.exists(soFile):
+        _build_so_file(kcfgPath, buildDir, soFile)
+
+    with _load_lock:
+        if soFile not in _loaded_so_files:
+            library = ctypes.CDLL(soFile)
+            library.loaded_so_file = soFile
+            _loaded_so_files.add(soFile)
+        else:
+            # dlopen() returns the already loaded instance for the same file, so load a uniquely named copy
+            fd, tmpFile = tempfile.mkstemp(suffix=".so", dir=buildDir)
+            os.close(fd)
+            try:
+                shutil.copyfile(soFile, tmpFile)
+                library = ctypes.CDLL(tmpFile)
+                library.loaded_so_file = None
+            finally:
+                os.unlink(tmpFile)
+
     if True:
         # void conf_parse(const char *name)
         library.conf_parse.argtypes = [ctypes.c_char_p]
@@ -57,6 +105,10 @@ def init_library(kernel_src_path):
         library.conf_write.argtypes = [ctypes.c_char_p]
         library.conf_write.restype = ctypes.c_int
 
+        # int conf_write_defconfig(const char *filename)
+        library.conf_write_defconfig.argtypes = [ctypes.c_char_p]
+        library.conf_write_defconfig.restype = ctypes.c_int
+
         # void conf_set_changed_callback(void (*fn)(void))
         library.conf_set_changed_callback.argtypes = [ctypes.c_void_p]                 # simplified, argument type is not important
         library.conf_set_changed_callback.restype = None
@@ -158,28 +210,84 @@ def init_library(kernel_src_path):
         library.expr_calc_value.argtypes = [ctypes.POINTER(struct_expr)]
         library.expr_calc_value.restype = ctypes.c_int
 
+        # struct pylkc_snapshot *pylkc_snapshot_new(void)
+        library.pylkc_snapshot_new.argtypes = []
+        library.pylkc_snapshot_new.restype = ctypes.c_void_p
+
+        # void pylkc_snapshot_restore(const struct pylkc_snapshot *snap)
+        library.pylkc_snapshot_restore.argtypes = [ctypes.c_void_p]
+        library.pylkc_snapshot_restore.restype = None
+
+        # void pylkc_snapshot_free(struct pylkc_snapshot *snap)
+        library.pylkc_snapshot_free.argtypes = [ctypes.c_void_p]
+        library.pylkc_snapshot_free.restype = None
+
+        # void pylkc_read_values(struct symbol **syms, int count,
+        #                        unsigned char *type, unsigned char *tri,
+        #                        unsigned char *visible, unsigned char *rev_dep_tri,
+        #                        int *flags)
+        library.pylkc_read_values.argtypes = [ctypes.POINTER(ctypes.POINTER(struct_symbol)), ctypes.c_int,
+                                              ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte),
+                                              ctypes.POINTER(ctypes.c_ubyte), ctypes.POINTER(ctypes.c_ubyte),
+                                              ctypes.POINTER(ctypes.c_int)]
+        library.pylkc_read_values.restype = None
+
+        # int pylkc_read_strings(struct symbol **syms, int count, char *buf, int size)
+        library.pylkc_read_strings.argtypes = [ctypes.POINTER(ctypes.POINTER(struct_symbol)), ctypes.c_int,
+                                               ctypes.c_char_p, ctypes.c_int]
+        library.pylkc_read_strings.restype = ctypes.c_int
+
+        # int pylkc_calc_all(int only_invalid)
+        library.pylkc_calc_all.argtypes = [ctypes.c_int]
+        library.pylkc_calc_all.restype = ctypes.c_int
+
         # struct symbol *symbol_hash[SYMBOL_HASHSIZE]
         g_symbol_hash_type = ctypes.POINTER(struct_symbol) * SYMBOL_HASHSIZE
         library.g_symbol_hash = g_symbol_hash_type.in_dll(library, "symbol_hash")
 
+        # struct file *file_list, newer kernels don't have it
+        try:
+            library.g_file_list = ctypes.POINTER(struct_file).in_dll(library, "file_list")
+        except ValueError:
+            library.g_file_list = None
 
-def fini_library():
-    global _kernel_src_path
-    global _kcfg_path
-    global _so_file
-    global library
+    return library
 
-    assert _kernel_src_path != ""
 
-    del library
-    library = None
-    library = library       # trick: to suppress pyflakes warning
+def unload_library(library):
+    """Unloads a library object returned by load_library(), neither it nor the objects got from it can be used any more.
+       The next load_library() of the same shared object loads it directly instead of loading a copy."""
+    with _load_lock:
+        _ctypes.dlclose(library._handle)
+        if library.loaded_so_file is not None:
+            _loaded_so_files.remove(library.loaded_so_file)
 
-    _clean_so_file()
 
-    _so_file = ""
-    _kcfg_path = ""
-    _kernel_src_path = ""
+def get_cache_dir():
+    """Directory where compiled shared objects are kept across processes"""
+    ret = os.environ.get("XDG_CACHE_HOME", "")
+    if ret == "":
+        ret = os.path.join(os.path.expanduser("~"), ".cache")
+    ret = os.path.join(ret, "pylkc")
+    os.makedirs(ret, exist_ok=True)
+    return ret
+
+
+def read_cache_file(filename):
+    """Reads a JSON file written by write_cache_file(), returns None if the file does not exist or is corrupted"""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_cache_file(filename, obj):
+    """Writes obj into filename as JSON, concurrent readers never see a partial file"""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with _atomic_output(filename) as tmpFile:
+        with open(tmpFile, "w") as f:
+            json.dump(obj, f)
 
 
 # typedef enum tristate {
@@ -281,6 +389,10 @@ class struct_expr(ctypes.Structure):
     pass
 
 
+class struct_file(ctypes.Structure):
+    pass
+
+
 class union_expr_data(ctypes.Union):
     pass
 
@@ -386,68 +498,204 @@ struct_menu._fields_ = [("next", ctypes.POINTER(struct_menu)),
                         ("lineno", ctypes.c_int),
                         ("data", ctypes.c_void_p), ]
 
+# struct file {
+#         struct file *next;
+#         struct file *parent;
+#         const char *name;
+#         int lineno;
+# };
+struct_file._fields_ = [("next", ctypes.POINTER(struct_file)),
+                        ("parent", ctypes.POINTER(struct_file)),
+                        ("name", ctypes.c_char_p),
+                        ("lineno", ctypes.c_int), ]
+
 
 ############## implementations ################################################
 
 
 _kernel_src_path = ""
-_kcfg_path = ""
-_so_file = ""
-
-
-def _build_so_file():
-    global _kernel_src_path
-    global _kcfg_path
-    global _so_file
-
-    # generate lexer.lex.c
-    cmd = ["flex", "-o", os.path.join(_kcfg_path, "lexer.lex.c"), "-L", os.path.join(_kcfg_path, "lexer.l")]
-    proc = subprocess.Popen(cmd)
-    proc.wait()
-
-    # generate parser.tab.h
-    subprocess.Popen([
-        "bison",
-        "-o",
-        "/dev/null",
-        "--defines=%s" % (os.path.join(_kcfg_path, "parser.tab.h")),
-        "-t",
-        "-l",
-        os.path.join(_kcfg_path, "parser.y")
-    ]).wait()
-
-    # generate parser.tab.c
-    subprocess.Popen([
-        "bison",
-        "-o",
-        os.path.join(_kcfg_path, "parser.tab.c"),
-        "-t",
-        "-l",
-        os.path.join(_kcfg_path, "parser.y")
-    ]).wait()
-
-    # generate pylkc.so
-    subprocess.Popen([
-        "cc",
-        "-fPIC",
-        "-shared",
-        os.path.join(_kcfg_path, "util.c"),
-        os.path.join(_kcfg_path, "conf.c"),
-        os.path.join(_kcfg_path, "confdata.c"),
-        os.path.join(_kcfg_path, "expr.c"),
-        os.path.join(_kcfg_path, "symbol.c"),
-        os.path.join(_kcfg_path, "preprocess.c"),
-        os.path.join(_kcfg_path, "menu.c"),
-        os.path.join(_kcfg_path, "lexer.lex.c"),
-        os.path.join(_kcfg_path, "parser.tab.c"),
-        "-o",
-        os.path.join(_kcfg_path, "pylkc.so")
-    ]).wait()
-
-
-def _clean_so_file():
-    global _kernel_src_path
-    global _kcfg_path
-    global _so_file
-
-    os.unlink(_so_file)
+_load_lock = threading.Lock()
+_loaded_so_files = set()            # shared objects loaded without a copy, by the library objects not unloaded yet
+
+
+_compiler = "cc"
+_cflags = ["-fPIC"]                 # "-I LINUX_SOURCE_DIRECTORY/scripts/kconfig" is added when compiling
+_ldflags = ["-shared"]
+_src_files = [
+    "util.c",
+    "conf.c",
+    "confdata.c",
+    "expr.c",
+    "symbol.c",
+    "preprocess.c",
+    "menu.c",
+]
+_gen_src_files = [
+    "lexer.lex.c",
+    "parser.tab.c",
+]
+_helper_src_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "helper.c")
+_toolchain_key = None
+
+
+def _get_build_key(kcfg_path, build_dir):
+    h = hashlib.sha1()
+
+    # kconfig sources, generated files are determined by lexer.l and parser.y
+    fnList = _get_build_files(kcfg_path)
+    for fn in fnList[:-1]:
+        h.update(os.path.basename(fn).encode("utf_8"))
+        with open(fn, "rb") as f:
+            h.update(f.read())
+
+    # our own helper functions
+    with open(fnList[-1], "rb") as f:
+        h.update(f.read())
+
+    h.update(_get_toolchain_key(build_dir).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _get_build_files(kcfg_path):
+    # all the source files of the shared object, except the generated ones, our own helper functions are the last
+    fnList = _src_files + ["lexer.l", "parser.y"]
+    fnList += sorted(x for x in os.listdir(kcfg_path) if x.endswith(".h") and x != "parser.tab.h")
+    return [os.path.join(kcfg_path, x) for x in fnList] + [_helper_src_file]
+
+
+def _get_toolchain_key(cache_dir=None):
+    global _toolchain_key
+
+    if _toolchain_key is None:
+        # running the tools is slow, so the key is saved in cache_dir, looked up by the path, inode, size and
+        # modification time of every tool, a warm start runs no subprocess
+        if cache_dir is None:
+            cache_dir = get_cache_dir()
+        statList = []
+        for tool in [_compiler, "flex", "bison"]:
+            fn = os.path.realpath(shutil.which(tool) or tool)
+            try:
+                st = os.stat(fn)
+                statList.append([fn, st.st_ino, st.st_size, st.st_mtime_ns])
+            except FileNotFoundError:
+                statList.append([fn, None, None, None])
+        statList.append(_cflags + _ldflags)
+        keyFile = os.path.join(cache_dir, "toolchain-%s.json" % (hashlib.sha1(json.dumps(statList).encode("utf_8")).hexdigest()))
+
+        _toolchain_key = read_cache_file(keyFile)
+        if _toolchain_key is None:
+            _toolchain_key = _compute_toolchain_key()
+            write_cache_file(keyFile, _toolchain_key)
+    return _toolchain_key
+
+
+def _compute_toolchain_key():
+    # compiler identity and flags, code generators are part of the tool chain too
+    h = hashlib.sha1()
+    h.update(os.path.realpath(shutil.which(_compiler) or _compiler).encode("utf_8"))
+    for cmd in [[_compiler, "--version"], ["flex", "--version"], ["bison", "--version"]]:
+        h.update(subprocess.check_output(cmd))
+    h.update(" ".join(_cflags + _ldflags).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _build_so_file(kcfg_path, build_dir, so_file):
+    # code generators write into a private directory, so concurrent builders never overwrite each other's files
+    genDir = tempfile.mkdtemp(prefix="gen-", dir=build_dir)
+    try:
+        # generate lexer.lex.c, parser.tab.h and parser.tab.c, the code generators don't depend on each other
+        # they run in genDir with relative output names, so the generated files don't contain the random directory name,
+        # which would make the keys of all the object files different in every build
+        procList = [
+            subprocess.Popen([
+                "flex",
+                "-o",
+                "lexer.lex.c",
+                "-L",
+                os.path.abspath(os.path.join(kcfg_path, "lexer.l"))
+            ], cwd=genDir),
+            subprocess.Popen([
+                "bison",
+                "-o",
+                "/dev/null",
+                "--defines=parser.tab.h",
+                "-t",
+                "-l",
+                os.path.abspath(os.path.join(kcfg_path, "parser.y"))
+            ], cwd=genDir),
+            subprocess.Popen([
+                "bison",
+                "-o",
+                "parser.tab.c",
+                "-t",
+                "-l",
+                os.path.abspath(os.path.join(kcfg_path, "parser.y"))
+            ], cwd=genDir),
+        ]
+        for proc in procList:
+            if proc.wait() != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+        # compile every translation unit in parallel
+        # object files are content addressed, so units whose inputs have not changed are not compiled again
+        objDir = os.path.join(build_dir, "obj")
+        os.makedirs(objDir, exist_ok=True)
+        hdrKey = _get_header_key(kcfg_path, genDir)
+        objList = []
+        srcList = [os.path.join(kcfg_path, x) for x in _src_files]
+        srcList += [os.path.join(genDir, x) for x in _gen_src_files]
+        srcList.append(_helper_src_file)
+        for srcFile in srcList:
+            objFile = os.path.join(objDir, "%s-%s.o" % (os.path.basename(srcFile)[:-2], _get_object_key(srcFile, hdrKey, build_dir)))
+            objList.append((srcFile, objFile))
+        with concurrent.futures.ThreadPoolExecutor(multiprocessing.cpu_count()) as executor:
+            for f in [executor.submit(_build_object_file, kcfg_path, x[0], x[1]) for x in objList]:
+                f.result()
+    finally:
+        shutil.rmtree(genDir)
+
+    # generate pylkc.so, build into a temporary file and rename, so that concurrent builders never see a partial file
+    _check_call_to_file([_compiler] + _ldflags + [x[1] for x in objList] + ["-o"], so_file)
+
+
+def _get_header_key(kcfg_path, gen_dir):
+    h = hashlib.sha1()
+    for d in [kcfg_path, gen_dir]:
+        for fn in sorted(x for x in os.listdir(d) if x.endswith(".h")):
+            h.update(fn.encode("utf_8"))
+            with open(os.path.join(d, fn), "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def _get_object_key(src_file, hdr_key, build_dir):
+    h = hashlib.sha1()
+    with open(src_file, "rb") as f:
+        h.update(f.read())
+    h.update(hdr_key.encode("utf_8"))
+    h.update(_get_toolchain_key(build_dir).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _build_object_file(kcfg_path, src_file, obj_file):
+    if os.path.exists(obj_file):
+        return
+    _check_call_to_file([_compiler] + _cflags + ["-I", kcfg_path, "-c", src_file, "-o"], obj_file)
+
+
+def _check_call_to_file(cmd, out_file):
+    with _atomic_output(out_file) as tmpFile:
+        subprocess.check_call(cmd + [tmpFile])
+
+
+@contextlib.contextmanager
+def _atomic_output(out_file):
+    # write into a temporary file and rename, so that concurrent readers never see a partial file
+    fd, tmpFile = tempfile.mkstemp(suffix=os.path.splitext(out_file)[1], dir=os.path.dirname(out_file))
+    os.close(fd)
+    try:
+        yield tmpFile
+        os.rename(tmpFile, out_file)
+    except BaseException:
+        os.unlink(tmpFile)
+        raise
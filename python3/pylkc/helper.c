@@ -0,0 +1,202 @@
+/*
+ * Helper functions compiled into pylkc.so together with the kconfig sources.
+ *
+ * They operate on all the symbols in one call, so that the python side
+ * needs not do several ctypes calls for every symbol.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include "lkc.h"
+
+/*
+ * snapshot of the value state of all the symbols
+ */
+
+struct pylkc_sym_state {
+	struct symbol *sym;
+	struct symbol_value curr;
+	struct symbol_value def[S_DEF_COUNT];
+	tristate visible;
+	int flags;
+};
+
+struct pylkc_snapshot {
+	int count;
+	struct pylkc_sym_state states[];
+};
+
+static int pylkc_is_snapshot_type(struct symbol *sym)
+{
+	switch (sym->type) {
+	case S_BOOLEAN:
+	case S_TRISTATE:
+	case S_INT:
+	case S_HEX:
+	case S_STRING:
+		return 1;
+	default:
+		return 0;
+	}
+}
+
+static int pylkc_is_string_type(struct symbol *sym)
+{
+	return sym->type == S_INT || sym->type == S_HEX || sym->type == S_STRING;
+}
+
+struct pylkc_snapshot *pylkc_snapshot_new(void)
+{
+	struct pylkc_snapshot *snap;
+	struct pylkc_sym_state *st;
+	struct symbol *sym;
+	int i, j, count;
+
+	count = 0;
+	for_all_symbols(i, sym)
+		if (pylkc_is_snapshot_type(sym))
+			count++;
+
+	snap = malloc(sizeof(*snap) + count * sizeof(snap->states[0]));
+	if (!snap)
+		return NULL;
+	snap->count = count;
+
+	st = snap->states;
+	for_all_symbols(i, sym) {
+		if (!pylkc_is_snapshot_type(sym))
+			continue;
+		st->sym = sym;
+		st->curr = sym->curr;
+		memcpy(st->def, sym->def, sizeof(st->def));
+		st->visible = sym->visible;
+		st->flags = sym->flags;
+		/* string values are owned by the symbol, keep our own copy */
+		if (pylkc_is_string_type(sym)) {
+			st->curr.val = NULL;
+			for (j = 0; j < S_DEF_COUNT; j++)
+				if (st->def[j].val)
+					st->def[j].val = strdup(st->def[j].val);
+		}
+		st++;
+	}
+
+	return snap;
+}
+
+void pylkc_snapshot_restore(const struct pylkc_snapshot *snap)
+{
+	const struct pylkc_sym_state *st;
+	struct symbol *sym;
+	int i, j;
+
+	for (i = 0; i < snap->count; i++) {
+		st = &snap->states[i];
+		sym = st->sym;
+		if (pylkc_is_string_type(sym)) {
+			for (j = 0; j < S_DEF_COUNT; j++) {
+				free(sym->def[j].val);
+				sym->def[j].tri = st->def[j].tri;
+				sym->def[j].val = st->def[j].val ? strdup(st->def[j].val) : NULL;
+			}
+		} else {
+			memcpy(sym->def, st->def, sizeof(sym->def));
+		}
+		sym->curr = st->curr;
+		sym->visible = st->visible;
+		sym->flags = st->flags;
+	}
+
+	/*
+	 * the current value of a string symbol may point to the value of
+	 * another symbol, so they are all re-calculated from the restored
+	 * state instead of being restored
+	 */
+	for (i = 0; i < snap->count; i++) {
+		sym = snap->states[i].sym;
+		if (pylkc_is_string_type(sym))
+			sym->flags &= ~SYMBOL_VALID;
+	}
+	for (i = 0; i < snap->count; i++) {
+		sym = snap->states[i].sym;
+		if (pylkc_is_string_type(sym))
+			sym_calc_value(sym);
+	}
+}
+
+void pylkc_snapshot_free(struct pylkc_snapshot *snap)
+{
+	int i, j;
+
+	for (i = 0; i < snap->count; i++)
+		if (pylkc_is_string_type(snap->states[i].sym))
+			for (j = 0; j < S_DEF_COUNT; j++)
+				free(snap->states[i].def[j].val);
+	free(snap);
+}
+
+void pylkc_read_values(struct symbol **syms, int count,
+		       unsigned char *type, unsigned char *tri,
+		       unsigned char *visible, unsigned char *rev_dep_tri,
+		       int *flags)
+{
+	struct symbol *sym;
+	int i;
+
+	for (i = 0; i < count; i++) {
+		sym = syms[i];
+		type[i] = sym_get_type(sym);
+		tri[i] = sym->curr.tri;
+		visible[i] = sym->visible;
+		rev_dep_tri[i] = sym->rev_dep.tri;
+		flags[i] = sym->flags;
+	}
+}
+
+/*
+ * string values of the int, hex and string symbols, each followed by a '\0',
+ * the other symbols get empty strings. returns the size the values need,
+ * nothing is written into buf if size is smaller than that.
+ */
+int pylkc_read_strings(struct symbol **syms, int count, char *buf, int size)
+{
+	const char *val;
+	int i, len, total;
+
+	total = 0;
+	for (i = 0; i < count; i++) {
+		if (pylkc_is_string_type(syms[i]))
+			total += strlen(sym_get_string_value(syms[i]));
+		total++;
+	}
+	if (total > size)
+		return total;
+
+	for (i = 0; i < count; i++) {
+		if (pylkc_is_string_type(syms[i])) {
+			val = sym_get_string_value(syms[i]);
+			len = strlen(val);
+			memcpy(buf, val, len);
+			buf += len;
+		}
+		*buf++ = '\0';
+	}
+	return total;
+}
+
+int pylkc_calc_all(int only_invalid)
+{
+	struct symbol *sym;
+	int i, count;
+
+	count = 0;
+	for_all_symbols(i, sym) {
+		if (sym->type == S_OTHER)
+			continue;
+		if (only_invalid && (sym->flags & SYMBOL_VALID))
+			continue;
+		sym_calc_value(sym);
+		count++;
+	}
+	return count;
+}
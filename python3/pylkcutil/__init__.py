@@ -33,3 +33,4 @@ __version__ = "0.0.1"
 
 from . import generator
 from . import checker
+from . import pool
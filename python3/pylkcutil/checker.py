@@ -37,40 +37,14 @@ class CheckError(Exception):
 
 
 def check_value(ksrcDir, cfgFile, name, value):
-    pylkc.init(ksrcDir)
-    try:
-        pylkc.conf_parse(ksrcDir)
-        pylkc.conf_read(cfgFile)
-        for sym in pylkc.all_symbols():
-            sym.calc_value()
-        if name.startswith("/"):
-            ret = _getChoice(name)
-            if ret != value:
-                raise CheckError(name, value, ret)
-        else:
-            ret = _getValue(name)
-            if ret != value:
-                raise CheckError(name, value, ret)
-    finally:
-        pylkc.release()
+    check_values(ksrcDir, cfgFile, {name: value})
 
 
 def check_values(ksrcDir, cfgFile, valueDict):
     pylkc.init(ksrcDir)
     try:
         pylkc.conf_parse(ksrcDir)
-        pylkc.conf_read(cfgFile)
-        for sym in pylkc.all_symbols():
-            sym.calc_value()
-        for k, v in valueDict.items():
-            if k.startswith("/"):
-                ret = _getChoice(k)
-                if ret != v:
-                    raise CheckError(k, v, ret)
-            else:
-                ret = _getValue(k)
-                if ret != v:
-                    raise CheckError(k, v, ret)
+        _checkValues(cfgFile, valueDict)
     finally:
         pylkc.release()
 
@@ -78,6 +52,21 @@ def check_values(ksrcDir, cfgFile, valueDict):
 ############## implementations ################################################
 
 
+def _checkValues(cfgFile, valueDict):
+    # kconfig tree is parsed by the caller
+    pylkc.conf_read(cfgFile)
+    pylkc.calc_all()
+    for k, v in valueDict.items():
+        if k.startswith("/"):
+            ret = _getChoice(k)
+            if ret != v:
+                raise CheckError(k, v, ret)
+        else:
+            ret = _getValue(k)
+            if ret != v:
+                raise CheckError(k, v, ret)
+
+
 def _getValue(symbolName):
     sym = pylkc.sym_find(symbolName)
     if sym.get_type() == pylkc.symbol.TYPE_UNKNOWN:
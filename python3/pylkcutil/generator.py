@@ -74,11 +74,22 @@
      3. allnoconfig+module
 """
 
+"""cacheDir:
+     If not None, the following data is saved in this directory, keyed by the fingerprint of the kconfig tree:
+       1. the base state of allnoconfig and allnoconfig+module, later runs replay the saved values instead of computing them again.
+       2. the result of generate(), a later run with the same inputs writes the saved .config and replays the saved events
+          without loading lkc at all.
+"""
+
 
 import os
 import re
+import heapq
+import hashlib
 import pylkc
 import pylkcx
+import pylkcx.graph
+import pylkcx.fingerprint
 from multiprocessing import Process
 
 
@@ -94,6 +105,54 @@ class EventHandler:
     def choiceChanged(self, menuPath, choiceValue):
         pass
 
+    def valuePropagated(self, name, recalcCount):
+        # name is symbol name or choice menu path, recalcCount is the number of symbols re-calculated after it is set
+        pass
+
+    def ruleRequeued(self, lineNo, count):
+        # items generated by rule lineNo are re-executed count times in total, reported before stage "finished"
+        pass
+
+    def cacheDisabled(self, reason):
+        # cacheDir is given but nothing is read from or written into it, reason is a message string
+        pass
+
+
+class EventRecorder(EventHandler):
+    """Records events, so that they can be replayed to another EventHandler later.
+       The events are passed to eventHandler at the same time if it is not None."""
+
+    def __init__(self, eventHandler=None):
+        self.eventList = []
+        self.eventHandler = eventHandler
+
+    def progressChanged(self, stage):
+        self._record("progressChanged", (stage,))
+
+    def symbolChanged(self, symbolName, symbolValue):
+        self._record("symbolChanged", (symbolName, symbolValue))
+
+    def choiceChanged(self, menuPath, choiceValue):
+        self._record("choiceChanged", (menuPath, choiceValue))
+
+    def valuePropagated(self, name, recalcCount):
+        self._record("valuePropagated", (name, recalcCount))
+
+    def ruleRequeued(self, lineNo, count):
+        self._record("ruleRequeued", (lineNo, count))
+
+    def cacheDisabled(self, reason):
+        self._record("cacheDisabled", (reason,))
+
+    def _record(self, name, args):
+        self.eventList.append((name, args))
+        if self.eventHandler is not None:
+            getattr(self.eventHandler, name)(*args)
+
+    def replay(self, eventHandler):
+        for name, args in self.eventList:
+            getattr(eventHandler, name)(*args)
+
 
 class SyntaxError(Exception):
 
@@ -115,9 +174,9 @@ class ConflictError(Exception):
                 msg = "rule %d (%s): symbol %s conflicts with value record" % (ln, rule, item.symbolMenu.sym.name)
         elif item.choiceMenu is not None:
             if recSym is not None:
-                msg = "rule %d (%s): choice \"%s\" conflicts with value record \"%s=%s\"" % (ln, rule, _getMenuPath(item.choiceMenu), recSym.name, context.symValueRecord[recSym])
+                msg = "rule %d (%s): choice \"%s\" conflicts with value record \"%s=%s\"" % (ln, rule, pylkc.menu_get_path(item.choiceMenu), recSym.name, context.symValueRecord[recSym])
             else:
-                msg = "rule %d (%s): choice \"%s\" conflicts with value record" % (ln, rule, _getMenuPath(item.choiceMenu))
+                msg = "rule %d (%s): choice \"%s\" conflicts with value record" % (ln, rule, pylkc.menu_get_path(item.choiceMenu))
         else:
             assert False
 
@@ -140,12 +199,18 @@ class InternalError(Exception):
         super(InternalError, self).__init__(message)
 
 
-def generate(ksrcDir, baseConfig, ruleFile, baseConfigFilename=None, output=None, eventHandler=None):
+def generate(ksrcDir, baseConfig, ruleFile, baseConfigFilename=None, output=None, eventHandler=None, cacheDir=None):
     if baseConfig == "file":
         assert baseConfigFilename is not None
     if output is None:
         output = os.path.join(ksrcDir, ".config")
 
+    if cacheDir is not None:
+        resultFile = os.path.join(cacheDir, "result-%s.json" % (_getResultKey(ksrcDir, baseConfig, ruleFile, baseConfigFilename)))
+        if _loadResult(ksrcDir, cacheDir, resultFile, output, eventHandler):
+            return
+        eventHandler = EventRecorder(eventHandler)
+
     context = _Context()
     context.eventHandler = eventHandler
     if context.eventHandler is not None:
@@ -154,83 +219,26 @@ def generate(ksrcDir, baseConfig, ruleFile, baseConfigFilename=None, output=None
     pylkc.init(ksrcDir)
     try:
         pylkc.conf_parse(ksrcDir)
-
-        # load base config
-        if baseConfig == "defconfig":
-            _makeDefConfig(ksrcDir, "")
-        elif baseConfig == "allnoconfig":
-            _makeAllNoConfig()
-        elif baseConfig == "allnoconfig+module":
-            _makeAllNoConfig()
-            pylkc.sym_find("MODULES").set_tristate_value(pylkc.tristate.yes)
-        elif baseConfig == "file":
-            pylkc.conf_read(baseConfigFilename)
-        else:
-            assert False
-        for sym in pylkc.all_symbols():
-            sym.calc_value()
-        if context.eventHandler is not None:
-            context.eventHandler.progressChanged("base-config-loaded")
-
-        # parse rule file
-        context.parseRuleFile(ruleFile)
-        if context.eventHandler is not None:
-            context.eventHandler.progressChanged("rule-file-parsed")
-
-        # record pre-set values
-        if baseConfig == "allnoconfig":
-            _presetSymbol(context, "EXPERT", "y")
-            _presetSymbol(context, "EMBEDDED", "y")
-        elif baseConfig == "allnoconfig+module":
-            _presetSymbol(context, "EXPERT", "y")
-            _presetSymbol(context, "EMBEDDED", "y")
-            _presetSymbol(context, "MODULES", "y")
-        else:
-            pass
-
-        # do operation
-        while len(context.itemRunList) > 0:
-            item = context.itemRunList.pop(0)
-            if item.symbolMenu is not None:
-                if item.value.startswith("\""):
-                    _procSymbolNonYmn(context, item)
-                elif _is_int(item.value):
-                    _procSymbolNonYmn(context, item)
-                else:
-                    _procSymbolYmn(context, item)
-            elif item.choiceMenu is not None:
-                _procChoice(context, item)
-            else:
-                assert False
-
-        pylkc.conf_write(output)
-
-        # final check:
-        # 1. check if any symbol is ignored by invisibility
-        for item in context.itemRunList:
-            if item.symbolMenu is not None:
-                if item.symbolMenu in context.symValueRecord:
-                    continue
-                if item.symbolMenu.sym.get_type() not in [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE]:
-                    continue
-                if item.value == "n":
-                    continue
-                if not item.vforce:
-                    continue
-                raise NotExecutedError(context, item, "invisibility")
-            elif item.choiceMenu is not None:
-                if any(m in context.symValueRecord for m in item.choiceMenu.list):
-                    continue
-                raise NotExecutedError(context, item, "invisibility")
-            else:
-                assert False
-
-        pylkc.conf_write(output)
-        if context.eventHandler is not None:
-            context.eventHandler.progressChanged("finished")
+        cacheDir = _getUsableCacheDir(context, cacheDir)
+        if cacheDir is not None:
+            fileList = pylkc.parsed_files()
+            fingerprint = pylkcx.fingerprint.get_fingerprint(cacheDir)
+            baseFileList = _getBaseConfigFiles(baseConfig, baseConfigFilename)
+        _generate(context, ksrcDir, baseConfig, ruleFile, baseConfigFilename, output, cacheDir)
     finally:
         pylkc.release()
 
+    if cacheDir is not None and baseFileList is not None:
+        with open(output) as f:
+            buf = f.read()
+        pylkc.api.write_cache_file(resultFile, {
+            "fingerprint": fingerprint,
+            "files": fileList,
+            "base-files": baseFileList,
+            "config": buf,
+            "events": eventHandler.eventList,
+        })
+
 
 ############## implementations ################################################
 
@@ -255,30 +263,76 @@ class _Context:
         self.ruleDict = dict()              # <ruleNo-int, rule-string>, const
         self.itemList = []                  # const
         self.symRefDict = dict()            # <symbol, symbol-list>, const, visibility and constraint of "symbol-list" may change if "symbol" changes
+        self.symRefGraph = None             # pylkcx.graph.graph, const, same content as symRefDict
         self.symItemDict = dict()           # <symbol, item-list>, const, "item-list" need re-exec if "symbol" changes
 
-        self.itemRunList = []
+        self.itemRunList = None             # _RunQueue
         self.symValueDict = dict()          # <symbol, (value, visible, rev_dep.tri)>
         self.symValueRecord = dict()        # <symbol, value-string>
         self.symAltValueRecord = dict()     # <symbol, value-string-list>
 
-    def parseRuleFile(self, ruleFile):
+    def parseRuleFile(self, ruleFile, cacheDir=None):
         # fill self.ruleDict
-        lineList = []
-        with open(ruleFile) as f:
-            lineList = f.read().split("\n")
-        for i in range(0, len(lineList)):
-            line = lineList[i].strip()
-            if line == "":                      # remove empty line
-                continue
-            if line.startswith("#"):            # remove comment
-                continue
-            m = re.match("^(.*?) +#.*$", line)  # remove comment
-            if m is not None:
-                line = m.group(1)
-            self.ruleDict[i + 1] = line
+        self.ruleDict = _readRuleFile(ruleFile)
 
         # fill self.itemList
+        if cacheDir is not None:
+            compiledFile = os.path.join(cacheDir, "rules-%s.json" % (_getCompiledRuleKey(self.ruleDict, cacheDir)))
+            compiledList = pylkc.api.read_cache_file(compiledFile)
+            if compiledList is not None:
+                self._loadCompiledItems(compiledList)
+            else:
+                self._generateItems()
+                pylkc.api.write_cache_file(compiledFile, self._compileItems())
+        else:
+            self._generateItems()
+
+        # fill self.symRefDict
+        symList = pylkc.all_symbols()
+        self.symRefGraph = pylkcx.graph.get_graph(pylkcx.graph.EDGE_SELECT | pylkcx.graph.EDGE_DEPENDS)
+        for i, sym in enumerate(symList):
+            self.symRefDict[sym] = [symList[x] for x in self.symRefGraph.successors(i)]
+
+        # fill self.symItemDict
+        for item in self.itemList:
+            if item.symbolMenu is not None:
+                if item.symbolMenu.sym in self.symItemDict:
+                    self.symItemDict[item.symbolMenu.sym].append(item)
+                else:
+                    self.symItemDict[item.symbolMenu.sym] = [item]
+            elif item.choiceMenu is not None:
+                for m in item.choiceMenu.list:
+                    if m.sym in self.symItemDict:
+                        self.symItemDict[m.sym].append(item)
+                    else:
+                        self.symItemDict[m.sym] = [item]
+            else:
+                assert False
+
+        # fill self.itemRunList
+        self.itemRunList = _RunQueue(self.itemList)
+
+        # fill self.symValueDict
+        values = pylkc.read_values()
+        for i, sym in enumerate(pylkc.all_symbols()):
+            if values.type[i] == pylkc.symbol.TYPE_BOOLEAN:
+                v = "n" if values.tri[i] == pylkc.tristate.no else "y"
+            elif values.type[i] == pylkc.symbol.TYPE_TRISTATE:
+                v = _tval2str(values.tri[i])
+            else:
+                v = _symGetValue(sym)
+            self.symValueDict[sym] = (v, values.visible[i], values.rev_dep_tri[i])
+
+    def _generateItems(self):
+        # resolve the rules against the menu tree
+        tagArray = pylkcx.get_all_menu_tags()
+        tagDict = {
+            "debugging-symbols": pylkcx.TAG_DEBUGGING,
+            "deprecated-symbols": pylkcx.TAG_DEPRECATED,
+            "workaround-symbols": pylkcx.TAG_WORKAROUND,
+            "experimental-symbols": pylkcx.TAG_EXPERIMENTAL,
+            "dangerous-symbols": pylkcx.TAG_DANGEROUS,
+        }
         for lineNo, line in self.ruleDict.items():
             key = line.split("=")[0]
             value = line.split("=")[1].strip("\t ")
@@ -290,49 +344,20 @@ class _Context:
                         return False
                 elif kis[0] == "normal-symbols":
                     mstr = kis[1]
+                    tagMask = pylkcx.TAG_DEBUGGING | pylkcx.TAG_DEPRECATED | pylkcx.TAG_WORKAROUND | pylkcx.TAG_EXPERIMENTAL | pylkcx.TAG_DANGEROUS
                     def _filterFunc(menuObj):
-                        if pylkcx.is_menu_debugging(menuObj):
-                            return True
-                        if pylkcx.is_menu_deprecated(menuObj):
-                            return True
-                        if pylkcx.is_menu_workaround(menuObj):
-                            return True
-                        if pylkcx.is_menu_experimental(menuObj):
-                            return True
-                        if pylkcx.is_menu_dangerous(menuObj):
-                            return True
-                        return False
-                elif kis[0] == "debugging-symbols":
-                    mstr = kis[1]
-                    def _filterFunc(menuObj):
-                        return not pylkcx.is_menu_debugging(menuObj)
-                elif kis[0] == "deprecated-symbols":
+                        return (tagArray[pylkc.menu_id(menuObj)] & tagMask) != 0
+                elif kis[0] in tagDict:
                     mstr = kis[1]
+                    tagMask = tagDict[kis[0]]
                     def _filterFunc(menuObj):
-                        return not pylkcx.is_menu_deprecated(menuObj)
-                elif kis[0] == "workaround-symbols":
-                    mstr = kis[1]
-                    def _filterFunc(menuObj):
-                        return not pylkcx.is_menu_workaround(menuObj)
-                elif kis[0] == "experimental-symbols":
-                    mstr = kis[1]
-                    def _filterFunc(menuObj):
-                        return not pylkcx.is_menu_experimental(menuObj)
-                elif kis[0] == "dangerous-symbols":
-                    mstr = kis[1]
-                    def _filterFunc(menuObj):
-                        return not pylkcx.is_menu_dangerous(menuObj)
+                        return (tagArray[pylkc.menu_id(menuObj)] & tagMask) == 0
                 elif kis[0] == "regex-symbols":
                     regexPattern = kis[1]
                     mstr = kis[2]
+                    symSet = set(pylkc.all_symbols()[i] for i in pylkc.sym_search_regex(regexPattern))
                     def _filterFunc(menuObj):
-                        if menuObj.sym is None:
-                            return True
-                        if menuObj.sym.name is None:
-                            return True
-                        if not re.match(regexPattern, menuObj.sym.name):
-                            return True
-                        return False
+                        return menuObj.sym not in symSet
                 elif kis[0] == "prompt-regex-symbols":
                     regexPattern = kis[1]
                     mstr = kis[2]
@@ -346,50 +371,33 @@ class _Context:
             else:
                 self._generateMenuInfoSymbol(lineNo, key, value)
 
-        # fill self.symRefDict
-        if True:
-            # init
-            for sym in pylkc.all_symbols():
-                self.symRefDict[sym] = set()
-
-            # for "Selects" expression
-            for sym in pylkc.all_symbols():
-                for prop in sym.get_properties(pylkc.property.TYPE_SELECT):
-                    self.symRefDict[sym].add(prop.get_symbol())
-
-            # for "Depends on" expression
-            for sym in pylkc.all_symbols():
-                for s in _allSymbolsInExpr(sym.dir_dep.expr):
-                    if s not in self.symRefDict:
-                        continue                     # ???
-                    self.symRefDict[s].add(sym)
-
-            # convert set to list
-            for k in self.symRefDict:
-                self.symRefDict[k] = list(self.symRefDict[k])
-
-        # fill self.symItemDict
+    def _compileItems(self):
+        # items are saved as (lineNo, type, menu-id, value, vforce), menu id is stable for the same fingerprint
+        ret = []
         for item in self.itemList:
             if item.symbolMenu is not None:
-                if item.symbolMenu.sym in self.symItemDict:
-                    self.symItemDict[item.symbolMenu.sym].append(item)
-                else:
-                    self.symItemDict[item.symbolMenu.sym] = [item]
+                ret.append((item.lineNo, "symbol", pylkc.menu_id(item.symbolMenu), item.value, item.vforce))
             elif item.choiceMenu is not None:
-                for m in item.choiceMenu.list:
-                    if m.sym in self.symItemDict:
-                        self.symItemDict[m.sym].append(item)
-                    else:
-                        self.symItemDict[m.sym] = [item]
+                ret.append((item.lineNo, "choice", pylkc.menu_id(item.choiceMenu), item.value, item.vforce))
             else:
                 assert False
+        return ret
 
-        # fill self.itemRunList
-        self.itemRunList = list(self.itemList)
-
-        # fill self.symValueDict
-        for sym in pylkc.all_symbols():
-            self.symValueDict[sym] = (_symGetValue(sym), sym.visible, sym.rev_dep.tri)
+    def _loadCompiledItems(self, compiledList):
+        menuList = pylkc.all_menus()
+        for lineNo, itemType, menuId, value, vforce in compiledList:
+            item = self._Item()
+            item.index = len(self.itemList)
+            item.lineNo = lineNo
+            if itemType == "symbol":
+                item.symbolMenu = menuList[menuId]
+            elif itemType == "choice":
+                item.choiceMenu = menuList[menuId]
+            else:
+                assert False
+            item.value = value
+            item.vforce = vforce
+            self.itemList.append(item)
 
     def _generateMenuInfoSymbol(self, lineNo, symbolName, value):
         sym = pylkc.sym_find(symbolName)
@@ -441,7 +449,8 @@ class _Context:
             menuObj = pylkc.menu_find_by_sym(pylkc.sym_find(mstr))
             if menuObj is None:
                 raise SyntaxError(self, lineNo, "menu %s not found" % (mstr))
-        self._generateMenuInfoSymbolsImpl(lineNo, menuObj, filterFunc, value)
+        for m in pylkc.menu_subtree(menuObj):
+            self._generateMenuInfoSymbolsImpl(lineNo, m, filterFunc, value)
 
     def _generateMenuInfoSymbolsImpl(self, lineNo, menuObj, filterFunc, value):
         recordSelf = True
@@ -468,8 +477,123 @@ class _Context:
             item.vforce = False
             self.itemList.append(item)
 
-        for m in menuObj.list:
-            self._generateMenuInfoSymbolsImpl(lineNo, m, filterFunc, value)
+
+class _RunQueue:
+    """Items to be executed, popped in the order of item index, an item is in the queue at most once"""
+
+    def __init__(self, itemList):
+        self._heap = list(itemList)
+        heapq.heapify(self._heap)
+        self._itemSet = set(itemList)
+        self.requeueCountDict = dict()      # <item, count>
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._itemSet
+
+    def __iter__(self):
+        return iter(sorted(self._heap))
+
+    def pop(self):
+        item = heapq.heappop(self._heap)
+        self._itemSet.remove(item)
+        return item
+
+    def push(self, item):
+        assert item not in self._itemSet
+        heapq.heappush(self._heap, item)
+        self._itemSet.add(item)
+        self.requeueCountDict[item] = self.requeueCountDict.get(item, 0) + 1
+
+
+def _generate(context, ksrcDir, baseConfig, ruleFile, baseConfigFilename, output, cacheDir):
+    # kconfig tree is parsed by the caller
+    cacheDir = _getUsableCacheDir(context, cacheDir)
+
+    # load base config
+    if baseConfig == "defconfig":
+        _makeDefConfig(ksrcDir, "")
+    elif baseConfig == "allnoconfig":
+        _makeAllNoConfig(cacheDir)
+    elif baseConfig == "allnoconfig+module":
+        _makeAllNoConfig(cacheDir)
+        pylkc.sym_find("MODULES").set_tristate_value(pylkc.tristate.yes)
+    elif baseConfig == "file":
+        pylkc.conf_read(baseConfigFilename)
+    else:
+        assert False
+    pylkc.calc_all()
+    if context.eventHandler is not None:
+        context.eventHandler.progressChanged("base-config-loaded")
+
+    # parse rule file
+    context.parseRuleFile(ruleFile, cacheDir)
+    if context.eventHandler is not None:
+        context.eventHandler.progressChanged("rule-file-parsed")
+
+    # record pre-set values
+    if baseConfig == "allnoconfig":
+        _presetSymbol(context, "EXPERT", "y")
+        _presetSymbol(context, "EMBEDDED", "y")
+    elif baseConfig == "allnoconfig+module":
+        _presetSymbol(context, "EXPERT", "y")
+        _presetSymbol(context, "EMBEDDED", "y")
+        _presetSymbol(context, "MODULES", "y")
+    else:
+        pass
+
+    # do operation
+    while len(context.itemRunList) > 0:
+        item = context.itemRunList.pop()
+        if item.symbolMenu is not None:
+            if item.value.startswith("\""):
+                _procSymbolNonYmn(context, item)
+            elif _is_int(item.value):
+                _procSymbolNonYmn(context, item)
+            else:
+                _procSymbolYmn(context, item)
+        elif item.choiceMenu is not None:
+            _procChoice(context, item)
+        else:
+            assert False
+
+    pylkc.conf_write(output)
+
+    # final check:
+    # 1. check if any symbol is ignored by invisibility
+    for item in context.itemRunList:
+        if item.symbolMenu is not None:
+            if item.symbolMenu in context.symValueRecord:
+                continue
+            if item.symbolMenu.sym.get_type() not in [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE]:
+                continue
+            if item.value == "n":
+                continue
+            if not item.vforce:
+                continue
+            raise NotExecutedError(context, item, "invisibility")
+        elif item.choiceMenu is not None:
+            if any(m in context.symValueRecord for m in item.choiceMenu.list):
+                continue
+            raise NotExecutedError(context, item, "invisibility")
+        else:
+            assert False
+
+    pylkc.conf_write(output)
+    if context.eventHandler is not None:
+        _reportRequeuedRules(context)
+        context.eventHandler.progressChanged("finished")
+
+
+def _reportRequeuedRules(context):
+    # items of the same rule line are summed up
+    requeueCountDict = dict()
+    for item, count in context.itemRunList.requeueCountDict.items():
+        requeueCountDict[item.lineNo] = requeueCountDict.get(item.lineNo, 0) + count
+    for lineNo in sorted(requeueCountDict):
+        context.eventHandler.ruleRequeued(lineNo, requeueCountDict[lineNo])
 
 
 def _procSymbolYmn(context, item):
@@ -497,16 +621,31 @@ def _procSymbolYmn(context, item):
         return False
 
     # set symbol value, do advanced conflict check
-    ovalue = _menuGetValue(item.symbolMenu)
-    bModified = _menuSetValue(context, item.symbolMenu, newvlist[0])
-    if bModified:
+    if item.vforce:
+        bModified = _menuSetValue(context, item.symbolMenu, newvlist[0])
+        if bModified:
+            _checkConflict(context, item)
+    elif _symValueEqual(item.symbolMenu.sym, newvlist[0]):
+        bModified = False
+    else:
+        # a non-forced item is rolled back on conflict, the value state is saved so that it can be restored without
+        # re-calculating the referenced symbols, the events are held back until the value is kept
+        snap = pylkc.snapshot()
+        eventHandler = context.eventHandler
+        if eventHandler is not None:
+            context.eventHandler = EventRecorder()
         try:
+            bModified = _menuSetValue(context, item.symbolMenu, newvlist[0])
             _checkConflict(context, item)
+            heldEvents = context.eventHandler
         except ConflictError:
-            if not item.vforce:
-                _menuSetValue(context, item.symbolMenu, ovalue)
-                return False
-            raise
+            pylkc.restore(snap)
+            return False
+        finally:
+            context.eventHandler = eventHandler
+        if eventHandler is not None:
+            heldEvents.replay(eventHandler)
+    if bModified:
         _updateItemRunList(context, item)
         _updateSymValueDict(context, item)
         if context.eventHandler is not None:
@@ -556,7 +695,7 @@ def _procChoice(context, item):
     # return True means symbol value changed, return False means symbol value not changed
     assert item.choiceMenu is not None
 
-    menuPath = _getMenuPath(item.choiceMenu)
+    menuPath = pylkc.menu_get_path(item.choiceMenu)
 
     # temporarily invisible
     if not item.choiceMenu.is_visible():
@@ -675,14 +814,13 @@ def _updateItemRunList(context, item):
                 _updateItemRunListImpl(context, item, s, recSet)
     else:
         assert False
-    context.itemRunList.sort()
 
 
 def _updateItemRunListImpl(context, item, sym, recSet):
     recSet.add(sym)
     for si in context.symItemDict.get(sym, []):
-        if _isVisibileAndConstraintRangeWider(context, si) and si not in context.itemRunList:
-            context.itemRunList.append(si)
+        if si not in context.itemRunList and _isVisibileAndConstraintRangeWider(context, si):
+            context.itemRunList.push(si)
     if context.symValueDict[sym][0] != _symGetValue(sym):      # oldv != newv
         for s in context.symRefDict.get(sym, []):
             if s in recSet:
@@ -740,34 +878,262 @@ def _isVisibileAndConstraintRangeWider(context, item):
         assert False
 
 
-def _makeAllNoConfig():
+def _makeAllNoConfig(cacheDir):
     pylkc.conf_read(None)
+    pylkc.calc_all()
+
+    if cacheDir is None:
+        _makeAllNoConfigImpl()
+        return
+
+    # the base state is saved as the values set on top of the start state
+    stateFile = os.path.join(cacheDir, "allnoconfig-%s.json" % (_getAllNoConfigKey(cacheDir)))
+    setList = pylkc.api.read_cache_file(stateFile)
+    if setList is not None:
+        snap = pylkc.snapshot()
+        if _replayAllNoConfig(setList):
+            return
+        pylkc.restore(snap)
+
+    setList = _makeAllNoConfigImpl()
+    pylkc.api.write_cache_file(stateFile, setList)
+
 
+def _makeAllNoConfigImpl():
     # clear all symbol setttings
+    # symbols are visited in dependency order, a symbol is visited again only when a symbol it depends on is changed
+    # returns the list of (symbol-id, value) that are set, in the order they are set
     defaultValueDict = {"EXPERT": pylkc.tristate.yes, "EMBEDDED": pylkc.tristate.yes}
+    symList = pylkc.all_symbols()
+    graph = pylkcx.graph.get_graph()
+    setList = []
     while True:
         changed = False
-        for sym in pylkc.all_symbols():
+
+        # the symbols that are already in place are not visited
+        values = pylkc.read_values()
+        heap = []
+        for i, sym in enumerate(symList):
+            if sym.name in defaultValueDict:
+                if values.tri[i] == defaultValueDict[sym.name]:
+                    continue
+            elif values.type[i] in [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE]:
+                if values.tri[i] == pylkc.tristate.no:
+                    continue
+            else:
+                continue
+            heap.append((graph.scc_index[i], i))
+        heapq.heapify(heap)
+        queued = bytearray(len(symList))
+        for scc, i in heap:
+            queued[i] = 1
+
+        while len(heap) > 0:
+            scc, i = heapq.heappop(heap)
+            queued[i] = 0
+
+            sym = symList[i]
             sym.calc_value()
             if sym.is_choice_value():
                 continue
             if sym.name in defaultValueDict:
                 if sym.get_tristate_value() == defaultValueDict[sym.name]:
                     continue
-                ret = sym.set_tristate_value(defaultValueDict[sym.name])
+                value = defaultValueDict[sym.name]
+                ret = sym.set_tristate_value(value)
                 if not ret:
                     raise InternalError("failed to set default value for symbol %s" % (sym.name))
             elif sym.get_type() in [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE]:
                 if sym.get_tristate_value() == pylkc.tristate.no:
                     continue
-                ret = sym.set_tristate_value(pylkc.tristate.no)
+                value = pylkc.tristate.no
+                ret = sym.set_tristate_value(value)
                 if not ret:
                     continue
             else:
                 continue
+            setList.append((i, value))
             changed = True
+
+            for j in graph.successors(i):
+                if not queued[j]:
+                    queued[j] = 1
+                    heapq.heappush(heap, (graph.scc_index[j], j))
+
+        # the graph doesn't have everything that can change a value (prompt conditions, choices, ...),
+        # so all the symbols are checked again until a round changes nothing, like the full sweep does
         if not changed:
             break
+        pylkc.calc_all()
+
+    return setList
+
+
+def _replayAllNoConfig(setList):
+    # returns False if the saved values can't be set, the symbol values are undefined in this case
+    # symbol ids are stable for the same fingerprint
+    symList = pylkc.all_symbols()
+    for i, value in setList:
+        if i >= len(symList):
+            return False
+        sym = symList[i]
+        sym.calc_value()
+        if not sym.set_tristate_value(value):
+            return False
+    return True
+
+
+def _getAllNoConfigKey(cacheDir):
+    # conf_read(None) may read a config file that is not a part of the kconfig tree,
+    # so the start state is a part of the key too
+    values = pylkc.read_values()
+    h = hashlib.sha1()
+    h.update(pylkcx.fingerprint.get_fingerprint(cacheDir).encode("utf_8"))
+    for arr in [values.type, values.tri, values.visible, values.flags]:
+        h.update(arr.tobytes())
+    for i, sym in enumerate(pylkc.all_symbols()):
+        if values.type[i] in [pylkc.symbol.TYPE_INT, pylkc.symbol.TYPE_HEX, pylkc.symbol.TYPE_STRING]:
+            h.update(("%s=%s\n" % (sym.name, sym.get_string_value())).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _readRuleFile(ruleFile):
+    # returns <ruleNo-int, rule-string>
+    ret = dict()
+    lineList = []
+    with open(ruleFile) as f:
+        lineList = f.read().split("\n")
+    for i in range(0, len(lineList)):
+        line = lineList[i].strip()
+        if line == "":                      # remove empty line
+            continue
+        if line.startswith("#"):            # remove comment
+            continue
+        m = re.match("^(.*?) +#.*$", line)  # remove comment
+        if m is not None:
+            line = m.group(1)
+        ret[i + 1] = line
+    return ret
+
+
+def _getUsableCacheDir(context, cacheDir):
+    # the cache entries are checked by the fingerprint of the parsed kconfig files,
+    # returns None if the kernel doesn't provide the list of parsed files, nothing is cached then
+    if cacheDir is None:
+        return None
+    try:
+        pylkc.parsed_files()
+    except pylkc.VersionError as e:
+        if context.eventHandler is not None:
+            context.eventHandler.cacheDisabled(str(e))
+        return None
+    return cacheDir
+
+
+def _getCodeKey():
+    # the classifier table and the code that resolves the selectors
+    h = hashlib.sha1()
+    h.update(pylkcx.get_tag_table_digest().encode("utf_8"))
+    for fn in [__file__, pylkcx.__file__]:
+        with open(fn, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _getCompiledRuleKey(ruleDict, cacheDir):
+    # items depend on the rules, the kconfig tree, the effective symbol types (tristate is boolean if MODULES is n),
+    # the classifier table and the code that resolves the selectors
+    h = hashlib.sha1()
+    h.update(pylkcx.fingerprint.get_fingerprint(cacheDir).encode("utf_8"))
+    h.update(pylkc.read_values().type.tobytes())
+    h.update(_getCodeKey().encode("utf_8"))
+    for lineNo, line in sorted(ruleDict.items()):
+        h.update(("%d:%s\n" % (lineNo, line)).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _getResultKey(ksrcDir, baseConfig, ruleFile, baseConfigFilename):
+    # the kconfig tree and the files read by conf_read(None) are not a part of the key, they are checked by _loadResult()
+    h = hashlib.sha1()
+    h.update(("%s\n%s\n" % (ksrcDir, baseConfig)).encode("utf_8"))
+    h.update(_getCodeKey().encode("utf_8"))
+    if baseConfig == "file":
+        for fn, digest in _getFileDigestList([os.path.abspath(baseConfigFilename)]):
+            h.update(("%s:%s\n" % (fn, digest)).encode("utf_8"))
+    for k, v in sorted(pylkc._get_environ(ksrcDir).items()):
+        h.update(("%s=%s\n" % (k, v)).encode("utf_8"))
+    for lineNo, line in sorted(_readRuleFile(ruleFile).items()):
+        h.update(("%d:%s\n" % (lineNo, line)).encode("utf_8"))
+    return h.hexdigest()
+
+
+def _loadResult(ksrcDir, cacheDir, resultFile, output, eventHandler):
+    result = pylkc.api.read_cache_file(resultFile)
+    if result is None:
+        return False
+    try:
+        if pylkcx.fingerprint.compute_fingerprint(ksrcDir, result["files"], cacheDir) != result["fingerprint"]:
+            return False
+    except OSError:
+        return False
+    if _getFileDigestList([x[0] for x in result["base-files"]]) != result["base-files"]:
+        return False
+
+    with open(output, "w") as f:
+        f.write(result["config"])
+    if eventHandler is not None:
+        recorder = EventRecorder()
+        recorder.eventList = result["events"]
+        recorder.replay(eventHandler)
+    return True
+
+
+def _getBaseConfigFiles(baseConfig, baseConfigFilename):
+    # returns the list of (filename, digest) of the files that may be read when loading base config,
+    # returns None if they can't be known in advance
+    if baseConfig == "file":
+        return _getFileDigestList([baseConfigFilename])
+    elif baseConfig in ["allnoconfig", "allnoconfig+module"]:
+        # conf_read(None) reads the first existing file in KCONFIG_CONFIG (default ".config") and the defaults of
+        # DEFCONFIG_LIST, a relative path is searched in current directory first, then in srctree
+        nameList = [os.environ.get("KCONFIG_CONFIG", ".config")]
+        sym = pylkc.sym_find("DEFCONFIG_LIST")
+        if sym is not None:
+            for prop in sym.get_properties(pylkc.property.TYPE_DEFAULT):
+                if prop.visible.expr is not None and prop.visible.expr.calc_value() == pylkc.tristate.no:
+                    continue
+                if prop.expr.type != pylkc.expr.TYPE_SYMBOL:
+                    continue
+                s = prop.expr.left.sym
+                s.calc_value()
+                nameList.append(s.get_string_value())
+        fnList = []
+        for name in nameList:
+            fnList.append(name)
+            if not os.path.isabs(name):
+                fnList.append(os.path.join(os.environ["srctree"], name))
+        ret = []
+        for item in _getFileDigestList(fnList):
+            ret.append(item)
+            if item[1] is not None:
+                break
+        return ret
+    else:
+        # defconfig results are not cached, the defconfig file is selected by arch and sub-arch
+        # inside _makeDefConfig(), so it can't be known in advance
+        return None
+
+
+def _getFileDigestList(fnList):
+    # digest is None if the file does not exist
+    ret = []
+    for fn in fnList:
+        try:
+            with open(fn, "rb") as f:
+                ret.append([fn, hashlib.sha1(f.read()).hexdigest()])
+        except FileNotFoundError:
+            ret.append([fn, None])
+    return ret
 
 
 def _makeDefConfig(ksrcDir, arch):
@@ -789,29 +1155,8 @@ def _menuSetValue(context, menuObj, symbolValue):
 
 def _symSetValue(context, sym, symbolValue):
     # if no need to modify, return directly
-    if sym.get_type() == pylkc.symbol.TYPE_UNKNOWN:
-        assert False
-    elif sym.get_type() == pylkc.symbol.TYPE_BOOLEAN:
-        assert symbolValue in ["y", "n"]
-        if sym.get_tristate_value() == _str2tval(symbolValue):
-            return False
-    elif sym.get_type() == pylkc.symbol.TYPE_TRISTATE:
-        assert symbolValue in ["y", "m", "n"]
-        if sym.get_tristate_value() == _str2tval(symbolValue):
-            return False
-    elif sym.get_type() == pylkc.symbol.TYPE_INT:
-        assert _is_int(symbolValue)
-        if sym.get_string_value() == symbolValue:
-            return False
-    elif sym.get_type() == pylkc.symbol.TYPE_HEX:
-        assert False
-    elif sym.get_type() == pylkc.symbol.TYPE_STRING:
-        if sym.get_string_value() == symbolValue:
-            return False
-    elif sym.get_type() == pylkc.symbol.TYPE_OTHER:
-        assert False
-    else:
-        assert False
+    if _symValueEqual(sym, symbolValue):
+        return False
 
     # change value
     if sym.get_type() == pylkc.symbol.TYPE_BOOLEAN:
@@ -827,16 +1172,32 @@ def _symSetValue(context, sym, symbolValue):
     assert ret
     sym.calc_value()
 
-    # calculate sym-ref value, try suppress sym-ref value change
-    change = 9999
-    while change > 0:
-        change = 0
-        for s in context.symRefDict.get(sym, []):
-            change += _calcAndSuppressSymRef(context, sym, s)
-
+    _propagateSymRef(context, sym.name, [sym])
     return True
 
 
+def _symValueEqual(sym, symbolValue):
+    if sym.get_type() == pylkc.symbol.TYPE_UNKNOWN:
+        assert False
+    elif sym.get_type() == pylkc.symbol.TYPE_BOOLEAN:
+        assert symbolValue in ["y", "n"]
+        return sym.get_tristate_value() == _str2tval(symbolValue)
+    elif sym.get_type() == pylkc.symbol.TYPE_TRISTATE:
+        assert symbolValue in ["y", "m", "n"]
+        return sym.get_tristate_value() == _str2tval(symbolValue)
+    elif sym.get_type() == pylkc.symbol.TYPE_INT:
+        assert _is_int(symbolValue)
+        return sym.get_string_value() == symbolValue
+    elif sym.get_type() == pylkc.symbol.TYPE_HEX:
+        assert False
+    elif sym.get_type() == pylkc.symbol.TYPE_STRING:
+        return sym.get_string_value() == symbolValue
+    elif sym.get_type() == pylkc.symbol.TYPE_OTHER:
+        assert False
+    else:
+        assert False
+
+
 def _setChoice(context, menuObj, choiceValue):
     bFound = False
     bNeedModify = False
@@ -860,18 +1221,47 @@ def _setChoice(context, menuObj, choiceValue):
     for m in menuObj.list:
         m.sym.calc_value()
 
+    _propagateSymRef(context, pylkc.menu_get_path(menuObj), [m.sym for m in menuObj.list])
+    return True
+
+
+def _propagateSymRef(context, name, symList):
     # calculate sym-ref value, try suppress sym-ref value change
-    change = 9999
+    # every symbol reachable from symList is calculated once per wave, in topological order,
+    # waves are repeated until no value is changed by suppression
+    allSymList = pylkc.all_symbols()
+    graph = context.symRefGraph
+    recalcCount = 0
+
+    change = 1
     while change > 0:
         change = 0
-        for m in menuObj.list:
-            for s in context.symRefDict.get(m.sym, []):
-                change += _calcAndSuppressSymRef(context, m.sym, s)
+        dirtySet = set()
+        queue = []
+        for sym in symList:
+            for i in graph.successors(pylkc.sym_id(sym)):
+                if i not in dirtySet:
+                    dirtySet.add(i)
+                    heapq.heappush(queue, (graph.scc_index[i], i))
+        while len(queue) > 0:
+            i = heapq.heappop(queue)[1]
+            c, bContinue = _calcAndSuppressSymRef(context, allSymList[i])
+            change += c
+            recalcCount += 1
+            if not bContinue:
+                continue
+            for j in graph.successors(i):
+                if j not in dirtySet:
+                    dirtySet.add(j)
+                    heapq.heappush(queue, (graph.scc_index[j], j))
 
-    return True
+    if context.eventHandler is not None:
+        context.eventHandler.valuePropagated(name, recalcCount)
 
 
-def _calcAndSuppressSymRef(context, osym, sym):
+def _calcAndSuppressSymRef(context, sym):
+    # returns (change, bContinue), change is 1 if the value of sym is changed by suppression,
+    # bContinue is False if the sym-refs of sym needs no calculation
     sym.calc_value()
 #    if _symGetValue(sym) == context.symValueDict[sym][0]:
 #        return 0
@@ -880,7 +1270,7 @@ def _calcAndSuppressSymRef(context, osym, sym):
     if sym.visible > pylkc.tristate.no and sym.get_type() in [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE] and not sym.is_choice_value():
         ov = _str2tval(context.symValueDict[sym][0])
         if sym.get_tristate_value() == ov:
-            return change
+            return (change, False)
         nv = ov
         while True:
             if nv > sym.visible:
@@ -898,10 +1288,7 @@ def _calcAndSuppressSymRef(context, osym, sym):
             assert ret
             change = 1
 
-    for s in context.symRefDict.get(sym, []):
-        change += _calcAndSuppressSymRef(context, osym, s)
-
-    return change
+    return (change, True)
 
 
 def _menuGetValue(menuObj):
@@ -944,16 +1331,6 @@ def _getChoice(menuObj):
     assert False
 
 
-def _getMenuPath(menuObj):
-    ret = ""
-    while True:
-        ret = "/" + pylkcx.path.escape(menuObj.get_prompt()) + ret
-        if menuObj.get_parent_menu() == menuObj:
-            break
-        menuObj = menuObj.get_parent_menu()
-    return ret
-
-
 def _vlistFilterByVisibleAndSelectionConstraint(menuObj, vlist):
     ret = []
     for v in vlist:
@@ -965,57 +1342,6 @@ def _vlistFilterByVisibleAndSelectionConstraint(menuObj, vlist):
     return ret
 
 
-def _allSymbolsInExpr(exprObj):
-    ret = []
-    if exprObj is None:
-        return []
-    if exprObj.type == pylkc.expr.TYPE_NONE:
-        return []
-    if exprObj.left is not None:
-        if exprObj.type in [pylkc.expr.TYPE_OR, pylkc.expr.TYPE_AND, pylkc.expr.TYPE_NOT, pylkc.expr.TYPE_LIST]:
-            ret += _allSymbolsInExpr(exprObj.left.expr)
-        elif exprObj.type in [pylkc.expr.TYPE_EQUAL, pylkc.expr.TYPE_UNEQUAL, pylkc.expr.TYPE_LTH, pylkc.expr.TYPE_LEQ, pylkc.expr.TYPE_GTH, pylkc.expr.TYPE_GEQ, pylkc.expr.TYPE_SYMBOL, pylkc.expr.TYPE_RANGE]:
-            ret.append(exprObj.left.sym)
-        else:
-            assert False
-    if exprObj.right is not None:
-        if exprObj.type in [pylkc.expr.TYPE_OR, pylkc.expr.TYPE_AND, pylkc.expr.TYPE_NOT, pylkc.expr.TYPE_LIST]:
-            ret += _allSymbolsInExpr(exprObj.right.expr)
-        elif exprObj.type in [pylkc.expr.TYPE_EQUAL, pylkc.expr.TYPE_UNEQUAL, pylkc.expr.TYPE_LTH, pylkc.expr.TYPE_LEQ, pylkc.expr.TYPE_GTH, pylkc.expr.TYPE_GEQ, pylkc.expr.TYPE_RANGE]:
-            ret.append(exprObj.right.sym)
-        else:
-            assert False
-    return ret
-
-
-def _isSymbolInExpr(sym, exprObj):
-    if exprObj is None:
-        return False
-    if exprObj.type == pylkc.expr.TYPE_NONE:
-        return False
-
-    if exprObj.left is not None:
-        if exprObj.type in [pylkc.expr.TYPE_OR, pylkc.expr.TYPE_AND, pylkc.expr.TYPE_NOT, pylkc.expr.TYPE_LIST]:
-            if _isSymbolInExpr(sym, exprObj.left.expr):
-                return True
-        elif exprObj.type in [pylkc.expr.TYPE_EQUAL, pylkc.expr.TYPE_UNEQUAL, pylkc.expr.TYPE_SYMBOL, pylkc.expr.TYPE_RANGE]:
-            if exprObj.left.sym == sym:
-                return True
-        else:
-            assert False
-    if exprObj.right is not None:
-        if exprObj.type in [pylkc.expr.TYPE_OR, pylkc.expr.TYPE_AND, pylkc.expr.TYPE_NOT, pylkc.expr.TYPE_LIST]:
-            if _isSymbolInExpr(sym, exprObj.right.expr):
-                return True
-        elif exprObj.type in [pylkc.expr.TYPE_EQUAL, pylkc.expr.TYPE_UNEQUAL, pylkc.expr.TYPE_RANGE]:
-            return exprObj.right.sym == sym
-            if exprObj.right.sym == sym:
-                return True
-        else:
-            assert False
-    return False
-
-
 def _is_int(s):
     try:
         int(s)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2005-2014 Fpemud <fpemud@sina.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import multiprocessing
+import pylkc
+from . import generator
+from . import checker
+
+
+class Pool:
+    """Parses the kconfig tree once in the current process, then runs every job in a forked child.
+       The child shares the parsed tree copy-on-write and exits after the job, so jobs never see each
+       other's symbol values, and the kconfig tree in this process is never modified.
+
+       The job methods block until the job is finished, the *_async variants return an object whose
+       get() method blocks. Exceptions raised by a job are re-raised by get() in this process."""
+
+    def __init__(self, ksrcDir, processes=None):
+        self.ksrcDir = ksrcDir
+        pylkc.init(ksrcDir)
+        try:
+            pylkc.conf_parse(ksrcDir)
+            self._pool = multiprocessing.get_context("fork").Pool(processes, maxtasksperchild=1)
+        except BaseException:
+            pylkc.release()
+            raise
+
+    def generate(self, baseConfig, ruleFile, baseConfigFilename=None, output=None, eventHandler=None, cacheDir=None):
+        return self.generate_async(baseConfig, ruleFile, baseConfigFilename, output, eventHandler, cacheDir).get()
+
+    def generate_async(self, baseConfig, ruleFile, baseConfigFilename=None, output=None, eventHandler=None, cacheDir=None):
+        if baseConfig == "file":
+            assert baseConfigFilename is not None
+        if output is None:
+            output = os.path.join(self.ksrcDir, ".config")
+        args = (self.ksrcDir, baseConfig, ruleFile, baseConfigFilename, output, cacheDir)
+        return _AsyncResult(self._pool.apply_async(_runJob, (_generateJob, args)), eventHandler)
+
+    def check_value(self, cfgFile, name, value):
+        return self.check_values(cfgFile, {name: value})
+
+    def check_values(self, cfgFile, valueDict):
+        return self.check_values_async(cfgFile, valueDict).get()
+
+    def check_values_async(self, cfgFile, valueDict):
+        return _AsyncResult(self._pool.apply_async(_runJob, (_checkValuesJob, (cfgFile, valueDict))), None)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            pylkc.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+############## implementations ################################################
+
+
+class _AsyncResult:
+
+    def __init__(self, asyncResult, eventHandler):
+        self._asyncResult = asyncResult
+        self._eventHandler = eventHandler
+
+    def ready(self):
+        return self._asyncResult.ready()
+
+    def get(self, timeout=None):
+        eventList, ret, error = self._asyncResult.get(timeout)
+
+        if self._eventHandler is not None:
+            recorder = generator.EventRecorder()
+            recorder.eventList = eventList
+            recorder.replay(self._eventHandler)
+
+        if error is not None:
+            # exception objects of pylkcutil can't be re-created by calling their constructors,
+            # so they are transferred in pieces
+            errorClass, errorArgs, errorAttrs = error
+            e = errorClass.__new__(errorClass)
+            e.args = errorArgs
+            e.__dict__.update(errorAttrs)
+            raise e
+
+        return ret
+
+
+def _runJob(func, args):
+    # runs in the child process
+    recorder = generator.EventRecorder()
+    try:
+        return (recorder.eventList, func(recorder, *args), None)
+    except Exception as e:
+        return (recorder.eventList, None, (e.__class__, e.args, e.__dict__))
+
+
+def _generateJob(recorder, ksrcDir, baseConfig, ruleFile, baseConfigFilename, output, cacheDir):
+    context = generator._Context()
+    context.eventHandler = recorder
+    context.eventHandler.progressChanged("initialized")
+    generator._generate(context, ksrcDir, baseConfig, ruleFile, baseConfigFilename, output, cacheDir)
+
+
+def _checkValuesJob(recorder, cfgFile, valueDict):
+    checker._checkValues(cfgFile, valueDict)
@@ -33,7 +33,14 @@ __version__ = "0.0.1"
 
 import os
 import re
+import json
+import array
+import hashlib
 import pylkc
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
 
 
 def get_kernel_version():
@@ -68,190 +75,302 @@ def compare_kernel_version(kernel_version1, kernel_version2):
     return 0
 
 
-def is_menu_debugging(menu_obj):
-    if menu_obj.sym is None or menu_obj.sym.name is None or menu_obj.prompt is None:
-        return False
-    if menu_obj.prompt.type == pylkc.property.TYPE_COMMENT:
-        return False
-
-    if re.search("(_|^)DEBUG(_|$)", menu_obj.sym.name):
-        return True
-    if re.search("(_|^)TRACING(_|$)", menu_obj.sym.name):
-        return True
-    if re.search("(_|^)TESTMODE(_|$)", menu_obj.sym.name):
-        return True
-    if re.search("(_|^)DEVELOPER(_|$)", menu_obj.sym.name):
-        return True
-    if re.search("(_|^)DEBUGFS(_|$)", menu_obj.sym.name):
-        return True
+TAG_DEBUGGING = 0x1
+TAG_DEPRECATED = 0x2
+TAG_WORKAROUND = 0x4
+TAG_EXPERIMENTAL = 0x8
+TAG_DANGEROUS = 0x10
 
-    if re.search("debug functions", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("debug interface", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("testing support", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("verbose .* error reporting", menu_obj.get_prompt(), re.I):
-        return True
 
-    menu_list = [
-        "KPROBES",
-        "KALLSYMS",
-        "KALLSYMS_ALL",
-        "X86_MCE_INJECT",                           # Machine check injector support
-        "NUMA_EMU",                                 # NUMA emulation
-        "X86_CHECK_BIOS_CORRUPTION",                # Check for low memory corruption
-        "CMDLINE_BOOL",                             # Built-in kernel command line
-        "PCIEAER_INJECT",
-        "INPUT_EVBUG",
-        "MAC80211_MESSAGE_TRACING",                 # Trace all mac80211 debug messages
-        "ATH5K_TEST_CHANNELS",                      # Enables testing channels on ath5k
-        "SCSI_LOGGING",                             # SCSI logging facility
-        # testers
-        "MEMTEST",
-        "ARCH_MEMORY_PROBE",                        # Enable sysfs memory/probe interface
-        "CRYPTO_TEST",
-        "CRC32_SELFTEST",
-        "GLOB_SELFTEST",
-        "XZ_DEC_TEST",
-        "CMDLINE_BOOL",
-        # end
-        "SND_SUPPORT_OLD_API",
-        "SND_VERBOSE_PROCFS",
-        "SND_VERBOSE_PRINTK",
-        # filesystem debugging
-        "BTRFS_FS_CHECK_INTEGRITY",
-        "BTRFS_FS_RUN_SANITY_TESTS",
-        "BTRFS_ASSERT",
-        "JFS_STATISTICS",
-        "REISERFS_CHECK",
-        "REISERFS_PROC_INFO",
-        "XFS_WARN",
-        # end
-        "V4L_TEST_DRIVERS",
-    ]
-    if menu_obj.sym.name in menu_list:
-        return True
-
-    return False
+def is_menu_debugging(menu_obj):
+    return (get_menu_tags(menu_obj) & TAG_DEBUGGING) != 0
 
 
 def is_menu_deprecated(menu_obj):
-    if menu_obj.sym is None or menu_obj.sym.name is None or menu_obj.prompt is None:
-        return False
-    if menu_obj.prompt.type == pylkc.property.TYPE_COMMENT:
-        return False
-
-    if re.search("deprecated", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("obsolete", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("legacy", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("very old", menu_obj.get_prompt(), re.I):
-        return True
-
-    menu_list = [
-        "USELIB",                                   # uselib syscall
-        "SYSFS_DEPRECATED",
-        "SYSFS_DEPRECATED_V2",
-        "NO_HZ",                                    # Old Idle dynticks config
-        "X86_MPPARSE",                              # Enable MPS table
-        "X86_VSYSCALL_EMULATION",
-        "AMD_NUMA",                                 # Old style AMD Opteron NUMA detection
-        "GART_IOMMU",                               # Old AMD GART IOMMU support
-        "ACPI_PROCFS_POWER",
-        "PROC_PID_CPUSET",                          # Include legacy /proc/<pid>/cpuset file
-        "DNOTIFY",                                  # deprecated by inotify
-        # deprecated by CONFIG_EFIVAR_FS
-        "EFI_VARS",
-        "EFI_RUNTIME_MAP",
-        # end
-        "ISA_DMA_API",                              # ISA-style DMA support, it's deprecated
-        "UEVENT_HELPER",
-        "FW_LOADER",
-        "FW_LOADER_USER_HELPER_FALLBACK",
-        "IP_NF_IPTABLES",
-        "IP_NF_ARPTABLES",
-        "IP6_NF_IPTABLES",
-        "NETFILTER_XTABLES",
-        "AF_RXRPC",
-        "VGA_SWITCHEROO",
-        "VIDEO_FIXED_MINOR_RANGES",
-        "MANDATORY_FILE_LOCKING",                   # Enable Mandatory file locking, dead code
-        "FB",
-        # deprecated by CONFIG_CPU_FREQ_GOV_SCHEDUTIL
-        "CPU_FREQ_GOV_ONDEMAND",
-        "CPU_FREQ_GOV_CONSERVATIVE",
-        # end
-        "X86_POWERNOW_K8",                          # too old
-        "INPUT_MOUSEDEV",
-        "INPUT_JOYDEV",
-    ]
-    if menu_obj.sym.name in menu_list:
-        return True
-
-    return False
+    return (get_menu_tags(menu_obj) & TAG_DEPRECATED) != 0
 
 
 def is_menu_workaround(menu_obj):
-    if menu_obj.sym is None or menu_obj.sym.name is None or menu_obj.prompt is None:
-        return False
-    if menu_obj.prompt.type == pylkc.property.TYPE_COMMENT:
-        return False
-
-    menu_list = [
-        "X86_REROUTE_FOR_BROKEN_BOOT_IRQS",    # Reroute for broken boot IRQs
-        "PCI_QUIRKS",                          # Enable PCI quirk workarounds
-        "COMPAT_VDSO",                         # Compat VDSO support
-        "DRM_LOAD_EDID_FIRMWARE",
-    ]
-    if menu_obj.sym.name in menu_list:
-        return True
-
-    return False
+    return (get_menu_tags(menu_obj) & TAG_WORKAROUND) != 0
 
 
 def is_menu_experimental(menu_obj):
-    if menu_obj.sym is None or menu_obj.sym.name is None or menu_obj.prompt is None:
-        return False
-    if menu_obj.prompt.type == pylkc.property.TYPE_COMMENT:
-        return False
-
-    if re.search("preliminary", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("experimental", menu_obj.get_prompt(), re.I):
-        return True
-
-    menu_list = [
-        "PCI_CNB20LE_QUIRK",                   # Read CNB20LE Host Bridge Windows
-        "STAGING",                             # Staging drivers
-    ]
-    if menu_obj.sym.name in menu_list:
-        return True
-
-    return False
+    return (get_menu_tags(menu_obj) & TAG_EXPERIMENTAL) != 0
 
 
 def is_menu_dangerous(menu_obj):
-    if menu_obj.sym is None or menu_obj.sym.name is None or menu_obj.prompt is None:
-        return False
+    return (get_menu_tags(menu_obj) & TAG_DANGEROUS) != 0
+
+
+def load_tag_table(filename, replace=False):
+    """Loads the symbol names and patterns of the tags from filename, the format is determined by the file extension:
+         .toml: one table for each tag, with optional keys "names", "name-patterns" and "prompt-patterns",
+                each of them is a list of strings, needs tomllib (python 3.11 and later)
+         .json: the same structure as the toml format
+         others: plain text, each line is "<tag> <key> <value>", key is "name", "name-pattern" or "prompt-pattern",
+                 such as "debugging name-pattern (_|^)DEBUG(_|$)", empty lines and lines starting with "#" are ignored
+       Tag names are debugging, deprecated, workaround, experimental and dangerous.
+       Name patterns are searched in symbol names, prompt patterns are searched in prompts case-insensitively.
+       The loaded entries are added to the current table, they replace the whole table if replace is True."""
+    global _tag_spec
+
+    spec = dict() if replace else {k: {x: list(y) for x, y in v.items()} for k, v in _tag_spec.items()}
+    for tag, value in _read_tag_file(filename).items():
+        for k, v in value.items():
+            spec.setdefault(tag, dict()).setdefault(k, []).extend(v)
+    _set_tag_spec(spec)
+    _clear_menu_tags()
+
+
+def reset_tag_table():
+    """Uses the built-in table"""
+    _set_tag_spec(_builtin_tag_spec)
+    _clear_menu_tags()
+
+
+def get_tag_table_digest():
+    """Returns a hex string which changes when the table changes"""
+    global _tag_table_digest
+    return _tag_table_digest
+
+
+def get_menu_tags(menu_obj):
+    """Returns the bitmask of TAG_* of a menu"""
+    return get_all_menu_tags()[pylkc.menu_id(menu_obj)]
+
+
+def get_all_menu_tags():
+    """Returns an array of the TAG_* bitmasks of all the menus, indexed by menu id (see pylkc.menu_id()).
+       It is computed in one pass and cached until pylkc.release()"""
+    cache = pylkc._parse_cache.setdefault(__name__, dict())
+    if "tags" not in cache:
+        cache["tags"] = array.array("i", [_compute_menu_tags(m) for m in pylkc.all_menus()])
+    return cache["tags"]
+
+
+############## implementations ################################################
+
+
+# <tag, <key, list>>, keys are "names", "name-patterns" and "prompt-patterns"
+_builtin_tag_spec = {
+    TAG_DEBUGGING: {
+        "names": [
+            "KPROBES",
+            "KALLSYMS",
+            "KALLSYMS_ALL",
+            "X86_MCE_INJECT",                           # Machine check injector support
+            "NUMA_EMU",                                 # NUMA emulation
+            "X86_CHECK_BIOS_CORRUPTION",                # Check for low memory corruption
+            "CMDLINE_BOOL",                             # Built-in kernel command line
+            "PCIEAER_INJECT",
+            "INPUT_EVBUG",
+            "MAC80211_MESSAGE_TRACING",                 # Trace all mac80211 debug messages
+            "ATH5K_TEST_CHANNELS",                      # Enables testing channels on ath5k
+            "SCSI_LOGGING",                             # SCSI logging facility
+            # testers
+            "MEMTEST",
+            "ARCH_MEMORY_PROBE",                        # Enable sysfs memory/probe interface
+            "CRYPTO_TEST",
+            "CRC32_SELFTEST",
+            "GLOB_SELFTEST",
+            "XZ_DEC_TEST",
+            "CMDLINE_BOOL",
+            # end
+            "SND_SUPPORT_OLD_API",
+            "SND_VERBOSE_PROCFS",
+            "SND_VERBOSE_PRINTK",
+            # filesystem debugging
+            "BTRFS_FS_CHECK_INTEGRITY",
+            "BTRFS_FS_RUN_SANITY_TESTS",
+            "BTRFS_ASSERT",
+            "JFS_STATISTICS",
+            "REISERFS_CHECK",
+            "REISERFS_PROC_INFO",
+            "XFS_WARN",
+            # end
+            "V4L_TEST_DRIVERS",
+        ],
+        "name-patterns": [
+            "(_|^)DEBUG(_|$)",
+            "(_|^)TRACING(_|$)",
+            "(_|^)TESTMODE(_|$)",
+            "(_|^)DEVELOPER(_|$)",
+            "(_|^)DEBUGFS(_|$)",
+        ],
+        "prompt-patterns": [
+            "debug functions",
+            "debug interface",
+            "testing support",
+            "verbose .* error reporting",
+        ],
+    },
+    TAG_DEPRECATED: {
+        "names": [
+            "USELIB",                                   # uselib syscall
+            "SYSFS_DEPRECATED",
+            "SYSFS_DEPRECATED_V2",
+            "NO_HZ",                                    # Old Idle dynticks config
+            "X86_MPPARSE",                              # Enable MPS table
+            "X86_VSYSCALL_EMULATION",
+            "AMD_NUMA",                                 # Old style AMD Opteron NUMA detection
+            "GART_IOMMU",                               # Old AMD GART IOMMU support
+            "ACPI_PROCFS_POWER",
+            "PROC_PID_CPUSET",                          # Include legacy /proc/<pid>/cpuset file
+            "DNOTIFY",                                  # deprecated by inotify
+            # deprecated by CONFIG_EFIVAR_FS
+            "EFI_VARS",
+            "EFI_RUNTIME_MAP",
+            # end
+            "ISA_DMA_API",                              # ISA-style DMA support, it's deprecated
+            "UEVENT_HELPER",
+            "FW_LOADER",
+            "FW_LOADER_USER_HELPER_FALLBACK",
+            "IP_NF_IPTABLES",
+            "IP_NF_ARPTABLES",
+            "IP6_NF_IPTABLES",
+            "NETFILTER_XTABLES",
+            "AF_RXRPC",
+            "VGA_SWITCHEROO",
+            "VIDEO_FIXED_MINOR_RANGES",
+            "MANDATORY_FILE_LOCKING",                   # Enable Mandatory file locking, dead code
+            "FB",
+            # deprecated by CONFIG_CPU_FREQ_GOV_SCHEDUTIL
+            "CPU_FREQ_GOV_ONDEMAND",
+            "CPU_FREQ_GOV_CONSERVATIVE",
+            # end
+            "X86_POWERNOW_K8",                          # too old
+            "INPUT_MOUSEDEV",
+            "INPUT_JOYDEV",
+        ],
+        "prompt-patterns": [
+            "deprecated",
+            "obsolete",
+            "legacy",
+            "very old",
+        ],
+    },
+    TAG_WORKAROUND: {
+        "names": [
+            "X86_REROUTE_FOR_BROKEN_BOOT_IRQS",    # Reroute for broken boot IRQs
+            "PCI_QUIRKS",                          # Enable PCI quirk workarounds
+            "COMPAT_VDSO",                         # Compat VDSO support
+            "DRM_LOAD_EDID_FIRMWARE",
+        ],
+    },
+    TAG_EXPERIMENTAL: {
+        "names": [
+            "PCI_CNB20LE_QUIRK",                   # Read CNB20LE Host Bridge Windows
+            "STAGING",                             # Staging drivers
+        ],
+        "prompt-patterns": [
+            "preliminary",
+            "experimental",
+        ],
+    },
+    TAG_DANGEROUS: {
+        "prompt-patterns": [
+            "dangerous",
+            "unsafe",
+            "use with caution",
+        ],
+    },
+}
+
+_tag_name_dict = {
+    "debugging": TAG_DEBUGGING,
+    "deprecated": TAG_DEPRECATED,
+    "workaround": TAG_WORKAROUND,
+    "experimental": TAG_EXPERIMENTAL,
+    "dangerous": TAG_DANGEROUS,
+}
+
+_tag_keys = ["names", "name-patterns", "prompt-patterns"]
+
+_tag_spec = None            # <tag, <key, list>>
+_tag_table = None           # [(tag, symbol name pattern, prompt pattern, symbol names)], None means no pattern
+_tag_table_digest = None
+
+
+def _set_tag_spec(spec):
+    global _tag_spec
+    global _tag_table
+    global _tag_table_digest
+
+    # compile before changing anything, so that a bad pattern leaves the current table in use
+    # all the patterns of a tag are combined into one regular expression
+    table = []
+    for tag in sorted(spec):
+        names = frozenset(spec[tag].get("names", []))
+        namePattern = None
+        promptPattern = None
+        if len(spec[tag].get("name-patterns", [])) > 0:
+            namePattern = re.compile("|".join("(?:%s)" % (x) for x in spec[tag]["name-patterns"]))
+        if len(spec[tag].get("prompt-patterns", [])) > 0:
+            promptPattern = re.compile("|".join("(?:%s)" % (x) for x in spec[tag]["prompt-patterns"]), re.I)
+        table.append((tag, namePattern, promptPattern, names))
+
+    _tag_spec = spec
+    _tag_table = table
+    _tag_table_digest = hashlib.sha1(json.dumps(sorted(spec.items()), sort_keys=True).encode("utf_8")).hexdigest()
+
+
+def _clear_menu_tags():
+    # masks of the parsed tree are computed again with the new table
+    if pylkc._parse_cache is not None:
+        pylkc._parse_cache.get(__name__, dict()).pop("tags", None)
+
+
+def _read_tag_file(filename):
+    # returns <tag, <key, list>>
+    if filename.endswith(".toml"):
+        if tomllib is None:
+            raise ImportError("tomllib is needed to read %s" % (filename))
+        with open(filename, "rb") as f:
+            data = tomllib.load(f)
+    elif filename.endswith(".json"):
+        with open(filename) as f:
+            data = json.load(f)
+    else:
+        data = dict()
+        with open(filename) as f:
+            for i, line in enumerate(f.read().split("\n")):
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                tlist = line.split(None, 2)
+                if len(tlist) != 3 or tlist[1] not in ["name", "name-pattern", "prompt-pattern"]:
+                    raise ValueError("%s:%d: invalid line \"%s\"" % (filename, i + 1, line))
+                data.setdefault(tlist[0], dict()).setdefault(tlist[1] + "s", []).append(tlist[2])
+
+    ret = dict()
+    for tagName, value in data.items():
+        if tagName not in _tag_name_dict:
+            raise ValueError("%s: invalid tag %s" % (filename, tagName))
+        for k, v in value.items():
+            if k not in _tag_keys or not isinstance(v, list) or not all(isinstance(x, str) for x in v):
+                raise ValueError("%s: invalid value for %s.%s" % (filename, tagName, k))
+        ret[_tag_name_dict[tagName]] = value
+    return ret
+
+
+def _compute_menu_tags(menu_obj):
+    sym = menu_obj.sym
+    if sym is None or sym.name is None or menu_obj.prompt is None:
+        return 0
     if menu_obj.prompt.type == pylkc.property.TYPE_COMMENT:
-        return False
+        return 0
 
-    if re.search("dangerous", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("unsafe", menu_obj.get_prompt(), re.I):
-        return True
-    if re.search("use with caution", menu_obj.get_prompt(), re.I):
-        return True
-
-    menu_list = [
-    ]
-    if menu_obj.sym.name in menu_list:
-        return True
-
-    return False
+    name = sym.name
+    prompt = menu_obj.get_prompt()
+    ret = 0
+    for tag, namePattern, promptPattern, names in _tag_table:
+        if name in names:
+            ret |= tag
+        elif namePattern is not None and namePattern.search(name):
+            ret |= tag
+        elif promptPattern is not None and promptPattern.search(prompt):
+            ret |= tag
+    return ret
 
 
 def _is_int(s):
@@ -260,3 +379,6 @@ def _is_int(s):
         return True
     except ValueError:
         return False
+
+
+_set_tag_spec(_builtin_tag_spec)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2005-2014 Fpemud <fpemud@sina.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""Semantic diff of two configs of the same parsed tree.
+Values are read in bulk by pylkc.read_values() and pylkc.read_string_values(), and compared block by block,
+only the blocks that differ are compared symbol by symbol.
+"""
+
+import pylkc
+from pylkc import api
+
+
+ORIGIN_USER = "user"                # value read from the config file, used because the symbol is visible
+ORIGIN_DEFAULT = "default"          # value of the default properties
+ORIGIN_SELECT = "select"            # value forced by other symbols through "select" (rev_dep)
+
+
+class config_values:
+    """Values of all the symbols at one moment, see read_current() and read_config()"""
+
+    def __init__(self, values, string_values):
+        self.values = values                    # pylkc.symbol_values
+        self.string_values = string_values      # return value of pylkc.read_string_values()
+
+    def get_value(self, i):
+        """Returns the value of symbol i as it is written in a config file, "n", "m", "y" or the string value"""
+        if self.values.type[i] in _ymn_types:
+            return _tri_str[self.values.tri[i]]
+        return self.string_values[i]
+
+    def get_origin(self, i):
+        """Returns ORIGIN_* of the value of symbol i"""
+        v = self.values
+        if v.type[i] in _ymn_types and v.rev_dep_tri[i] != pylkc.tristate.no and v.tri[i] == v.rev_dep_tri[i]:
+            return ORIGIN_SELECT
+        if (v.flags[i] & api.SYMBOL_DEF_USER) != 0 and v.visible[i] != pylkc.tristate.no:
+            return ORIGIN_USER
+        return ORIGIN_DEFAULT
+
+
+class change:
+
+    def __init__(self, name, old_value, new_value, old_origin, new_origin):
+        self.name = name
+        self.old_value = old_value
+        self.new_value = new_value
+        self.old_origin = old_origin
+        self.new_origin = new_origin
+
+
+def read_current():
+    """Reads the current values of all the symbols"""
+    pylkc.calc_all(only_invalid=True)
+    return config_values(pylkc.read_values(), pylkc.read_string_values())
+
+
+def read_config(filename):
+    """Reads the values of all the symbols after loading filename, the current values are changed by conf_read()"""
+    pylkc.conf_read(filename)
+    pylkc.calc_all()
+    return read_current()
+
+
+def diff(old, new, origin_changes=False):
+    """Returns the changes between two config_values objects as a list of (menu path, change list),
+       menu path is the path of the menu (not a symbol) that contains the symbols, None if the symbols are not
+       in any menu that has a path. The groups and the changes are in menu order.
+       If origin_changes is True, the symbols whose value is not changed but origin is changed are included."""
+    assert len(old.values) == len(new.values)
+
+    idSet = set()
+    idSet.update(_changed_ids(old.values.tri, new.values.tri))
+    idSet.update(_changed_ids(old.values.type, new.values.type))
+    idSet.update(_changed_ids(old.string_values, new.string_values))
+    if origin_changes:
+        for arr in ["rev_dep_tri", "flags", "visible"]:
+            for i in _changed_ids(getattr(old.values, arr), getattr(new.values, arr)):
+                if old.get_origin(i) != new.get_origin(i):
+                    idSet.add(i)
+
+    symList = pylkc.all_symbols()
+    changeList = []
+    for i in idSet:
+        oldValue = old.get_value(i)
+        newValue = new.get_value(i)
+        oldOrigin = old.get_origin(i)
+        newOrigin = new.get_origin(i)
+        if oldValue == newValue and (not origin_changes or oldOrigin == newOrigin):
+            continue
+        sym = symList[i]
+        menuObj = pylkc.menu_find_by_sym(sym)
+        if menuObj is not None:
+            parentMenu = menuObj.get_parent_menu()
+            key = (pylkc.menu_id(menuObj), pylkc.menu_get_path(parentMenu))
+        else:
+            key = (len(pylkc.all_menus()), None)
+        changeList.append((key, change(sym.name, oldValue, newValue, oldOrigin, newOrigin)))
+    changeList.sort(key=lambda x: x[0][0])
+
+    ret = []
+    groupDict = dict()
+    for (menuId, menuPath), c in changeList:
+        if menuPath not in groupDict:
+            groupDict[menuPath] = []
+            ret.append((menuPath, groupDict[menuPath]))
+        groupDict[menuPath].append(c)
+    return ret
+
+
+def diff_config_files(filename1, filename2, origin_changes=False):
+    """Same as diff(read_config(filename1), read_config(filename2), origin_changes), costs two conf_read() calls"""
+    return diff(read_config(filename1), read_config(filename2), origin_changes)
+
+
+############## implementations ################################################
+
+
+_ymn_types = [pylkc.symbol.TYPE_BOOLEAN, pylkc.symbol.TYPE_TRISTATE]
+
+_tri_str = ["n", "m", "y"]
+
+_block_size = 256
+
+
+def _changed_ids(seq1, seq2):
+    # equal blocks are skipped by slice comparison, which doesn't run python code for every element
+    ret = []
+    if seq1 == seq2:
+        return ret
+    for start in range(0, len(seq1), _block_size):
+        end = start + _block_size
+        if seq1[start:end] != seq2[start:end]:
+            ret += [i for i in range(start, min(end, len(seq1))) if seq1[i] != seq2[i]]
+    return ret
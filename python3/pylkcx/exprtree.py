@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2005-2014 Fpemud <fpemud@sina.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Compiles struct expr trees into tuple trees made of python objects.
+Node formats (t is a pylkc.expr.TYPE_* value):
+    (TYPE_OR, node, node)
+    (TYPE_AND, node, node)
+    (TYPE_NOT, node)
+    (TYPE_SYMBOL, symbol)
+    (TYPE_EQUAL, symbol, symbol), same for TYPE_UNEQUAL, TYPE_LTH, TYPE_LEQ, TYPE_GTH, TYPE_GEQ, TYPE_RANGE
+    (TYPE_LIST, node, symbol)
+A NULL expr is compiled to None, which evaluates to yes.
+Equal sub-trees are the same tuple object. The compiled trees are valid until pylkc.release().
+"""
+
+import re
+import ctypes
+import pylkc
+from pylkc import api
+
+
+def compile_expr(expr_obj):
+    """Returns the tree of expr_obj, expr_obj can be None"""
+    if expr_obj is None:
+        return None
+    return _compile(_get_cache(), expr_obj.c_expr_p)
+
+
+def symbols_in(node):
+    """Returns the frozenset of all the symbols in the tree, constant symbols included"""
+    if node is None:
+        return frozenset()
+    return _symbols_in(_get_cache(), node)
+
+
+def lower(node):
+    """Returns a function f(tri_values, str_values) which evaluates the tree like expr_calc_value().
+       tri_values[i] and str_values[i] are the tristate value and the string value of the symbol whose id is i,
+       for example pylkc.read_values().tri and [x.get_string_value() for x in pylkc.all_symbols()].
+       Symbol values must be calculated (by pylkc.calc_all()) before they are read into the arrays.
+       str_values is only used by comparison nodes. Constant symbols are not read from the arrays."""
+    if node is None:
+        return _eval_yes
+    return _lower(_get_cache(), node)
+
+
+############## implementations ################################################
+
+
+class _Cache:
+
+    def __init__(self):
+        if pylkc._kver_int_less_than("4.2"):
+            # linux-4.2 inserts 4 new enum value LTH,LEQ,GTH,GEQ before LIST
+            self.type_list = list(range(0, pylkc.expr.TYPE_UNEQUAL + 1)) + list(range(pylkc.expr.TYPE_LIST, pylkc.expr.TYPE_RANGE + 1))
+            self.string_compare_only = True
+        else:
+            self.type_list = list(range(0, pylkc.expr.TYPE_RANGE + 1))
+            self.string_compare_only = False
+        self.addr_dict = dict()             # <address, node>
+        self.intern_dict = dict()           # <(type, id(child), ...), node>
+        self.symbols_dict = dict()          # <id(node), frozenset>
+        self.lower_dict = dict()            # <id(node), function>
+
+
+_logic_types = [pylkc.expr.TYPE_OR, pylkc.expr.TYPE_AND]
+_compare_types = [pylkc.expr.TYPE_EQUAL, pylkc.expr.TYPE_UNEQUAL, pylkc.expr.TYPE_LTH, pylkc.expr.TYPE_LEQ, pylkc.expr.TYPE_GTH, pylkc.expr.TYPE_GEQ]
+
+
+def _get_cache():
+    ret = pylkc._parse_cache.get(__name__)
+    if ret is None:
+        ret = _Cache()
+        pylkc._parse_cache[__name__] = ret
+    return ret
+
+
+def _compile(cache, c_expr_p):
+    if not c_expr_p:
+        return None
+
+    addr = ctypes.addressof(c_expr_p.contents)
+    ret = cache.addr_dict.get(addr)
+    if ret is not None:
+        return ret
+
+    e = c_expr_p.contents
+    t = cache.type_list[e.type]
+    if t in _logic_types:
+        ret = (t, _compile(cache, e.left.expr), _compile(cache, e.right.expr))
+    elif t == pylkc.expr.TYPE_NOT:
+        ret = (t, _compile(cache, e.left.expr))
+    elif t == pylkc.expr.TYPE_SYMBOL:
+        ret = (t, pylkc.symbol(e.left.sym))
+    elif t in _compare_types or t == pylkc.expr.TYPE_RANGE:
+        ret = (t, pylkc.symbol(e.left.sym), pylkc.symbol(e.right.sym))
+    elif t == pylkc.expr.TYPE_LIST:
+        ret = (t, _compile(cache, e.left.expr), pylkc.symbol(e.right.sym))
+    else:
+        assert False
+
+    # children are interned already, so they are keyed by identity, which avoids hashing the whole sub-tree
+    key = tuple(id(x) if isinstance(x, tuple) else x for x in ret)
+    ret = cache.intern_dict.setdefault(key, ret)
+    cache.addr_dict[addr] = ret
+    return ret
+
+
+def _symbols_in(cache, node):
+    ret = cache.symbols_dict.get(id(node))
+    if ret is not None:
+        return ret
+
+    ret = set()
+    for x in node[1:]:
+        if isinstance(x, tuple):
+            ret |= _symbols_in(cache, x)
+        elif x is not None:
+            ret.add(x)
+    ret = frozenset(ret)
+    cache.symbols_dict[id(node)] = ret
+    return ret
+
+
+def _eval_yes(tri_values, str_values):
+    return pylkc.tristate.yes
+
+
+def _lower(cache, node):
+    ret = cache.lower_dict.get(id(node))
+    if ret is not None:
+        return ret
+
+    t = node[0]
+    if t == pylkc.expr.TYPE_AND:
+        f1 = _lower(cache, node[1])
+        f2 = _lower(cache, node[2])
+
+        def ret(tri_values, str_values):
+            v = f1(tri_values, str_values)
+            if v == pylkc.tristate.no:
+                return v
+            return min(v, f2(tri_values, str_values))
+    elif t == pylkc.expr.TYPE_OR:
+        f1 = _lower(cache, node[1])
+        f2 = _lower(cache, node[2])
+
+        def ret(tri_values, str_values):
+            v = f1(tri_values, str_values)
+            if v == pylkc.tristate.yes:
+                return v
+            return max(v, f2(tri_values, str_values))
+    elif t == pylkc.expr.TYPE_NOT:
+        f1 = _lower(cache, node[1])
+
+        def ret(tri_values, str_values):
+            return pylkc.tristate.yes - f1(tri_values, str_values)
+    elif t == pylkc.expr.TYPE_SYMBOL:
+        ret = _lower_tri(node[1])
+    elif t in _compare_types:
+        ret = _lower_compare(cache, t, node[1], node[2])
+    else:
+        # same as expr_calc_value()
+        def ret(tri_values, str_values):
+            return pylkc.tristate.no
+
+    cache.lower_dict[id(node)] = ret
+    return ret
+
+
+def _lower_tri(sym):
+    if sym.c_symbol_p.contents.flags & api.SYMBOL_CONST:
+        v = sym.get_tristate_value()
+        return lambda tri_values, str_values: v
+    else:
+        i = pylkc.sym_id(sym)
+        return lambda tri_values, str_values: tri_values[i]
+
+
+def _lower_str(sym):
+    if sym.c_symbol_p.contents.flags & api.SYMBOL_CONST:
+        v = sym.get_string_value()
+        return lambda str_values: v
+    else:
+        i = pylkc.sym_id(sym)
+        return lambda str_values: str_values[i]
+
+
+def _lower_compare(cache, t, sym1, sym2):
+    get1 = _lower_str(sym1)
+    get2 = _lower_str(sym2)
+    type1 = int(sym1.c_symbol_p.contents.type)
+    type2 = int(sym2.c_symbol_p.contents.type)
+    parse_numbers = not cache.string_compare_only and (type1 != api.S_STRING or type2 != api.S_STRING)
+
+    def ret(tri_values, str_values):
+        str1 = get1(str_values)
+        str2 = get2(str_values)
+        if parse_numbers:
+            res = _compare_values(str1, type1, str2, type2)
+        else:
+            res = _strcmp(str1, str2)
+        if t == pylkc.expr.TYPE_EQUAL:
+            return pylkc.tristate.yes if res == 0 else pylkc.tristate.no
+        elif t == pylkc.expr.TYPE_UNEQUAL:
+            return pylkc.tristate.yes if res != 0 else pylkc.tristate.no
+        elif t == pylkc.expr.TYPE_LTH:
+            return pylkc.tristate.yes if res < 0 else pylkc.tristate.no
+        elif t == pylkc.expr.TYPE_LEQ:
+            return pylkc.tristate.yes if res <= 0 else pylkc.tristate.no
+        elif t == pylkc.expr.TYPE_GTH:
+            return pylkc.tristate.yes if res > 0 else pylkc.tristate.no
+        elif t == pylkc.expr.TYPE_GEQ:
+            return pylkc.tristate.yes if res >= 0 else pylkc.tristate.no
+        else:
+            assert False
+
+    return ret
+
+
+# the number formats accepted by strtoll() and strtoull() when the whole string must be consumed
+_int_regex = re.compile("\\s*[+-]?[0-9]+\\Z")
+_hex_regex = re.compile("\\s*[+-]?(0[xX])?[0-9a-fA-F]+\\Z")
+_auto_regex = re.compile("\\s*([+-]?)(?:0[xX]([0-9a-fA-F]+)|(0[0-7]*)|([1-9][0-9]*))\\Z")
+
+
+def _parse_value(s, sym_type):
+    # same as expr_parse_string(), returns (kind, value), kind is "signed", "unsigned" or "string"
+    if sym_type in [api.S_BOOLEAN, api.S_TRISTATE]:
+        return ("signed", {"n": 0, "m": 1, "y": 2}.get(s, -1))
+    elif sym_type == api.S_INT:
+        if _int_regex.match(s):
+            v = int(s, 10)
+            if -(1 << 63) <= v < (1 << 63):
+                return ("signed", v)
+        return ("string", None)
+    elif sym_type == api.S_HEX:
+        if _hex_regex.match(s):
+            v = int(s, 16)
+            if -(1 << 64) < v < (1 << 64):
+                return ("unsigned", v % (1 << 64))
+        return ("string", None)
+    else:
+        m = _auto_regex.match(s)
+        if m is not None:
+            if m.group(2) is not None:
+                v = int(m.group(2), 16)
+            elif m.group(3) is not None:
+                v = int(m.group(3), 8)
+            else:
+                v = int(m.group(4), 10)
+            if m.group(1) == "-":
+                v = -v
+            if -(1 << 63) <= v < (1 << 63):
+                return ("signed", v)
+        return ("string", None)
+
+
+def _compare_values(str1, type1, str2, type2):
+    kind1, v1 = _parse_value(str1, type1)
+    kind2, v2 = _parse_value(str2, type2)
+    if kind1 == "string" or kind2 == "string":
+        return _strcmp(str1, str2)
+    if kind1 == "unsigned" or kind2 == "unsigned":
+        # signed values are re-interpreted as unsigned, as the C union does
+        v1 %= (1 << 64)
+        v2 %= (1 << 64)
+    return (v1 > v2) - (v1 < v2)
+
+
+def _strcmp(str1, str2):
+    b1 = str1.encode("utf_8")
+    b2 = str2.encode("utf_8")
+    return (b1 > b2) - (b1 < b2)
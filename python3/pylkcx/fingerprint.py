@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2005-2014 Fpemud <fpemud@sina.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""Fingerprint of the parsed kconfig tree.
+It changes when anything that can change the result of conf_parse() changes: the kconfig files that are read,
+the kernel version, the environment variables and the lkc library itself.
+So data derived from the parsed tree can be saved on disk and used by other processes, keyed by the fingerprint.
+
+The digest of every file is kept in a manifest in cache_dir (default is the pylkc cache directory) together with
+its inode, size and modification time. A file whose stat result matches the manifest is not read again, the other
+files are hashed in parallel.
+"""
+
+import os
+import time
+import hashlib
+import multiprocessing
+import concurrent.futures
+import pylkc
+from pylkc import api
+
+
+def get_fingerprint(cache_dir=None):
+    """Returns the fingerprint as a hex string, it is computed once and cached until pylkc.release()"""
+    cache = pylkc._parse_cache.setdefault(__name__, dict())
+    if "fingerprint" not in cache:
+        cache["fingerprint"] = _compute_fingerprint(os.environ["srctree"], os.environ, pylkc.parsed_files(), cache_dir)
+    return cache["fingerprint"]
+
+
+def compute_fingerprint(kernel_src_path, file_list, cache_dir=None):
+    """Computes the fingerprint without parsing the tree, file_list is the return value of pylkc.parsed_files()
+       of an earlier parse. The result equals the fingerprint of that parse if nothing is changed since then.
+       The environment variables are the ones pylkc.init() would set.
+       Raises OSError if any file in file_list can't be read."""
+    return _compute_fingerprint(kernel_src_path, pylkc._get_environ(kernel_src_path), file_list, cache_dir)
+
+
+############## implementations ################################################
+
+
+# the environment variables set by pylkc._get_environ()
+_environ_keys = ["ARCH", "SRCARCH", "KERNELVERSION", "srctree", "CC", "RUSTC", "LD"]
+
+# a file modified within this many seconds before it is hashed is not recorded in the manifest,
+# because another modification in the same timestamp granularity would not be noticed
+_racy_seconds = 2
+
+
+def _compute_fingerprint(srcDir, environ, fileList, cacheDir):
+    h = hashlib.sha1()
+
+    # lkc library: its source files are hashed below, the compiler only affects the library build
+    h.update(api._get_toolchain_key(cacheDir).encode("utf_8"))
+
+    # environment, KERNELVERSION comes from the version fields of the root Makefile
+    for k in _environ_keys:
+        h.update(("%s=%s\n" % (k, environ.get(k, ""))).encode("utf_8"))
+
+    # files
+    fnList = api._get_build_files(os.path.join(srcDir, "scripts", "kconfig")) + list(fileList)
+    for fn, digest in zip(fnList, _get_digests(srcDir, fnList, cacheDir)):
+        h.update(("%s\n%s\n" % (os.path.relpath(fn, srcDir), digest)).encode("utf_8"))
+
+    return h.hexdigest()
+
+
+def _get_digests(srcDir, fnList, cacheDir):
+    if cacheDir is None:
+        cacheDir = api.get_cache_dir()
+    manifestFile = os.path.join(cacheDir, "manifest-%s.json" % (hashlib.sha1(srcDir.encode("utf_8")).hexdigest()))
+
+    # manifest: <filename, [inode, size, mtime, digest]>
+    manifest = api.read_cache_file(manifestFile)
+    if manifest is None:
+        manifest = dict()
+
+    ret = []
+    hashList = []
+    now = time.time_ns()
+    for fn in fnList:
+        st = os.stat(fn)
+        key = [st.st_ino, st.st_size, st.st_mtime_ns]
+        item = manifest.get(fn)
+        if item is not None and item[:3] == key:
+            ret.append(item[3])
+        else:
+            ret.append(None)
+            hashList.append((len(ret) - 1, fn, key))
+
+    if len(hashList) > 0:
+        with concurrent.futures.ThreadPoolExecutor(multiprocessing.cpu_count()) as executor:
+            digestList = list(executor.map(_hash_file, [x[1] for x in hashList]))
+        for (i, fn, key), digest in zip(hashList, digestList):
+            ret[i] = digest
+            if key[2] < now - _racy_seconds * 1000 * 1000 * 1000:
+                manifest[fn] = key + [digest]
+            else:
+                manifest.pop(fn, None)
+        api.write_cache_file(manifestFile, manifest)
+
+    return ret
+
+
+def _hash_file(fn):
+    with open(fn, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
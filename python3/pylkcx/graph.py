@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2005-2014 Fpemud <fpemud@sina.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Dependency graph of the symbols, nodes are symbol ids (see pylkc.sym_id()).
+An edge goes from a symbol to a symbol whose value it can change:
+    EDGE_SELECT:  "config A select B" gives A -> B
+    EDGE_IMPLY:   "config A imply B" gives A -> B
+    EDGE_DEPENDS: "config B depends on A" gives A -> B
+    EDGE_DEFAULT: "config B default A if C" gives A -> B and C -> B
+Constant symbols have no edges.
+"""
+
+import array
+import pylkc
+from pylkc import api
+from . import exprtree
+
+
+EDGE_SELECT = 0x1
+EDGE_IMPLY = 0x2
+EDGE_DEPENDS = 0x4
+EDGE_DEFAULT = 0x8
+EDGE_ALL = 0xF
+
+
+class graph:
+    """Edges are stored in compressed sparse row format:
+       the successors of node i are targets[offsets[i]:offsets[i + 1]], the predecessors are
+       r_targets[r_offsets[i]:r_offsets[i + 1]].
+       Strongly connected components are computed when the graph is created, scc_index[i] is the index
+       of the component node i is in, the components are in topological order of the condensed graph,
+       so every edge goes from a component to itself or to a component with a larger index."""
+
+    def __init__(self, edge_types=EDGE_ALL):
+        assert edge_types & ~EDGE_ALL == 0
+
+        self.edge_types = edge_types
+        self.node_count = len(pylkc.all_symbols())
+
+        succList = _generate_edges(edge_types)
+        self.offsets, self.targets = _to_csr(succList)
+
+        predList = [[] for i in range(0, self.node_count)]
+        for i in range(0, self.node_count):
+            for j in succList[i]:
+                predList[j].append(i)
+        self.r_offsets, self.r_targets = _to_csr(predList)
+
+        self.scc_list, self.scc_index = _tarjan(self)
+
+    def successors(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def predecessors(self, i):
+        return self.r_targets[self.r_offsets[i]:self.r_offsets[i + 1]]
+
+    def topological_order(self):
+        """Returns all the node ids, a node comes after all the nodes that have a path to it,
+           except the nodes in the same strongly connected component"""
+        ret = []
+        for scc in self.scc_list:
+            ret += scc
+        return ret
+
+    def forward_closure(self, id_list):
+        """Returns the set of nodes reachable from the nodes in id_list, id_list included"""
+        return _closure(self.offsets, self.targets, self.node_count, id_list)
+
+    def reverse_closure(self, id_list):
+        """Returns the set of nodes that can reach the nodes in id_list, id_list included"""
+        return _closure(self.r_offsets, self.r_targets, self.node_count, id_list)
+
+
+def get_graph(edge_types=EDGE_ALL):
+    """Returns the graph of the parsed tree, it is created once for each edge_types and cached until pylkc.release()"""
+    cache = pylkc._parse_cache.setdefault(__name__, dict())
+    if edge_types not in cache:
+        cache[edge_types] = graph(edge_types)
+    return cache[edge_types]
+
+
+############## implementations ################################################
+
+
+def _generate_edges(edge_types):
+    symList = pylkc.all_symbols()
+    ret = [set() for i in range(0, len(symList))]
+
+    def _add_expr(e, j):
+        for s in exprtree.symbols_in(exprtree.compile_expr(e)):
+            i = _get_id(s)
+            if i is not None:
+                ret[i].add(j)
+
+    for j, sym in enumerate(symList):
+        if _get_id(sym) is None:
+            continue
+        if edge_types & EDGE_SELECT:
+            for prop in sym.get_properties(pylkc.property.TYPE_SELECT):
+                i = _get_id(prop.get_symbol())
+                if i is not None:
+                    ret[j].add(i)
+        if edge_types & EDGE_IMPLY and not pylkc._kver_int_less_than("4.10"):
+            # property type P_IMPLY is introduced in linux-4.10
+            for prop in sym.get_properties(pylkc.property.TYPE_IMPLY):
+                i = _get_id(prop.get_symbol())
+                if i is not None:
+                    ret[j].add(i)
+        if edge_types & EDGE_DEPENDS:
+            _add_expr(sym.dir_dep.expr, j)
+        if edge_types & EDGE_DEFAULT:
+            for prop in sym.get_properties(pylkc.property.TYPE_DEFAULT):
+                _add_expr(prop.expr, j)
+                _add_expr(prop.visible.expr, j)
+
+    for i in range(0, len(ret)):
+        ret[i].discard(i)
+        ret[i] = sorted(ret[i])
+    return ret
+
+
+def _get_id(sym):
+    if sym is None or sym.c_symbol_p.contents.flags & api.SYMBOL_CONST:
+        return None
+    return pylkc._sym_id_dict.get(sym)
+
+
+def _to_csr(adjList):
+    offsets = array.array("i", [0])
+    targets = array.array("i")
+    for x in adjList:
+        targets.extend(x)
+        offsets.append(len(targets))
+    return (offsets, targets)
+
+
+def _tarjan(g):
+    # iterative Tarjan's algorithm, components are emitted in reverse topological order
+    index = array.array("i", [-1]) * g.node_count
+    lowlink = array.array("i", [0]) * g.node_count
+    onStack = bytearray(g.node_count)
+    stack = []
+    sccList = []
+    counter = 0
+
+    for root in range(0, g.node_count):
+        if index[root] != -1:
+            continue
+        work = [(root, g.offsets[root])]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = 1
+        while len(work) > 0:
+            v, k = work[-1]
+            if k < g.offsets[v + 1]:
+                work[-1] = (v, k + 1)
+                w = g.targets[k]
+                if index[w] == -1:
+                    index[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    onStack[w] = 1
+                    work.append((w, g.offsets[w]))
+                elif onStack[w]:
+                    lowlink[v] = min(lowlink[v], index[w])
+                continue
+            work.pop()
+            if len(work) > 0:
+                u = work[-1][0]
+                lowlink[u] = min(lowlink[u], lowlink[v])
+            if lowlink[v] == index[v]:
+                scc = []
+                while True:
+                    w = stack.pop()
+                    onStack[w] = 0
+                    scc.append(w)
+                    if w == v:
+                        break
+                sccList.append(sorted(scc))
+
+    sccList.reverse()
+    sccIndex = array.array("i", [0]) * g.node_count
+    for i, scc in enumerate(sccList):
+        for v in scc:
+            sccIndex[v] = i
+    return (sccList, sccIndex)
+
+
+def _closure(offsets, targets, node_count, id_list):
+    visited = bytearray(node_count)
+    ret = []
+    for i in id_list:
+        if not visited[i]:
+            visited[i] = 1
+            ret.append(i)
+    k = 0
+    while k < len(ret):
+        v = ret[k]
+        for w in targets[offsets[v]:offsets[v + 1]]:
+            if not visited[w]:
+                visited[w] = 1
+                ret.append(w)
+        k += 1
+    return set(ret)
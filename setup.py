@@ -47,4 +47,7 @@ setup(
         'pylkcx': 'python3/pylkcx',
         'pylkcutil': 'python3/pylkcutil',
     },
+    package_data={
+        'pylkc': ['helper.c'],
+    },
 )
@@ -3,22 +3,25 @@
 
 import os
 import sys
-import random
 import shutil
+import subprocess
 import unittest
 
 curDir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.join(curDir, "../python3"))
 import pylkc
 import pylkcutil
+import pylkcx.exprtree
+import pylkcx.graph
+import pylkcx.fingerprint
+import pylkcx.diff
 
 
 class util:
 
     @staticmethod
     def value_refresh():
-        for sym in pylkc.all_symbols():
-            sym.calc_value()
+        pylkc.calc_all()
 
 
 class Test_Linux_3_16(unittest.TestCase):
@@ -570,6 +573,98 @@ class Test_Menu_Structure(unittest.TestCase):
         pass
 
 
+class Test_Session(unittest.TestCase):
+    def setUp(self):
+        self.rootDir1 = os.path.join(curDir, "linux-4.0")
+        self.rootDir2 = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        s1 = pylkc.Session(self.rootDir1)
+        s2 = pylkc.Session(self.rootDir2)
+        try:
+            s1.conf_parse()
+            s2.conf_parse()
+
+            with s1:
+                pylkc.conf_read(None)
+                util.value_refresh()
+                self.assertEqual(os.environ["KERNELVERSION"], "4.0.0")
+                sym = pylkc.sym_find("DEFAULT_HOSTNAME")
+                ret = sym.set_string_value("abc")
+                self.assertTrue(ret)
+                util.value_refresh()
+
+            with s2:
+                pylkc.conf_read(None)
+                util.value_refresh()
+                self.assertEqual(os.environ["KERNELVERSION"], "5.1.15")
+                sym = pylkc.sym_find("DEFAULT_HOSTNAME")
+                self.assertEqual(sym.get_string_value(), "(none)")
+
+            with s1:
+                sym = pylkc.sym_find("DEFAULT_HOSTNAME")
+                self.assertEqual(sym.get_string_value(), "abc")
+        finally:
+            s2.close()
+            s1.close()
+
+
+class Test_LibraryUnload(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        for i in range(0, 2):
+            pylkc.init(self.rootDir)
+            try:
+                # the shared object is loaded directly, an open session loads a copy
+                self.assertEqual(len(pylkc.api._loaded_so_files), 1)
+                self.assertIsNotNone(pylkc.api.library.loaded_so_file)
+                s = pylkc.Session(self.rootDir)
+                self.assertIsNone(s._library.loaded_so_file)
+                s.close()
+                pylkc.conf_parse(self.rootDir)
+                self.assertIsNotNone(pylkc.sym_find("MODULES"))
+            finally:
+                pylkc.release()
+            self.assertEqual(len(pylkc.api._loaded_so_files), 0)
+
+
+class Test_Snapshot(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            util.value_refresh()
+
+            sym1 = pylkc.sym_find("MODULES")
+            sym2 = pylkc.sym_find("DEFAULT_HOSTNAME")
+            ret = sym1.set_tristate_value(pylkc.tristate.yes)
+            self.assertTrue(ret)
+            util.value_refresh()
+            snap = pylkc.snapshot()
+
+            ret = sym1.set_tristate_value(pylkc.tristate.no)
+            self.assertTrue(ret)
+            ret = sym2.set_string_value("abc")
+            self.assertTrue(ret)
+            util.value_refresh()
+            self.assertEqual(sym1.get_tristate_value(), pylkc.tristate.no)
+            self.assertEqual(sym2.get_string_value(), "abc")
+
+            pylkc.restore(snap)
+            self.assertEqual(sym1.get_tristate_value(), pylkc.tristate.yes)
+            self.assertEqual(sym2.get_string_value(), "(none)")
+
+            del snap
+        finally:
+            pylkc.release()
+
+
 class Test_Path_1(unittest.TestCase):
     def runTest(self):
         self.assertEqual(pylkc.path.basename(""), "")
@@ -635,6 +730,737 @@ class Test_Path_7(unittest.TestCase):
         self.assertTrue(pylkc.path.compare_fuzzy("/General Setup", "/General setup"))
 
 
+class Test_RunQueue(unittest.TestCase):
+    def runTest(self):
+        itemList = []
+        for i, lineNo in enumerate([1, 1, 2, 3]):
+            item = pylkcutil.generator._Context._Item()
+            item.index = i
+            item.lineNo = lineNo
+            itemList.append(item)
+
+        q = pylkcutil.generator._RunQueue([itemList[2], itemList[0], itemList[3]])
+        self.assertEqual(list(q), [itemList[0], itemList[2], itemList[3]])
+        self.assertEqual(q.pop(), itemList[0])
+        self.assertNotIn(itemList[0], q)
+
+        # an item is in the queue at most once
+        q.push(itemList[1])
+        q.push(itemList[0])
+        self.assertRaises(AssertionError, q.push, itemList[0])
+        self.assertEqual(len(q), 4)
+        self.assertEqual([q.pop() for i in range(0, 3)], [itemList[0], itemList[1], itemList[2]])
+        q.push(itemList[0])
+        self.assertEqual(q.pop(), itemList[0])
+        self.assertEqual(q.requeueCountDict, {itemList[0]: 2, itemList[1]: 1})
+
+        context = pylkcutil.generator._Context()
+        context.eventHandler = pylkcutil.generator.EventRecorder()
+        context.itemRunList = q
+        pylkcutil.generator._reportRequeuedRules(context)
+        self.assertEqual(context.eventHandler.eventList, [("ruleRequeued", (1, 3))])
+
+
+class Test_BuildCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = os.path.join(curDir, "tmp")
+        self.kcfgDir = os.path.join(self.tmpDir, "kconfig")
+        self.buildDir = os.path.join(self.tmpDir, "build")
+        os.makedirs(self.kcfgDir, exist_ok=True)
+        for fn in pylkc.api._src_files + ["helper.c"]:
+            with open(os.path.join(self.kcfgDir, fn), "w") as f:
+                f.write("#include \"lkc.h\"\nint pylkc_test_%s(void) { return PYLKC_TEST; }\n" % (fn[:-2]))
+        with open(os.path.join(self.kcfgDir, "lkc.h"), "w") as f:
+            f.write("#define PYLKC_TEST 1\n")
+        with open(os.path.join(self.kcfgDir, "lexer.l"), "w") as f:
+            f.write("%option noyywrap\n%%\n.|\\n ;\n%%\n")
+        with open(os.path.join(self.kcfgDir, "parser.y"), "w") as f:
+            f.write("%{\nint yylex(void);\nvoid yyerror(const char *s) {}\n%}\n%%\ninput: ;\n%%\n")
+        self.helperSrcFile = pylkc.api._helper_src_file
+        pylkc.api._helper_src_file = os.path.join(self.kcfgDir, "helper.c")        # the real one needs the real lkc.h
+
+    def runTest(self):
+        # the key is stable, and changes with the sources
+        key = pylkc.api._get_build_key(self.kcfgDir, self.buildDir)
+        self.assertEqual(pylkc.api._get_build_key(self.kcfgDir, self.buildDir), key)
+        self.assertTrue(any(x.startswith("toolchain-") for x in os.listdir(self.buildDir)))
+
+        # everything is put in build_dir, the code generator directory is removed
+        soFile = os.path.join(self.buildDir, "%s.so" % (key))
+        pylkc.api._build_so_file(self.kcfgDir, self.buildDir, soFile)
+        self.assertTrue(os.path.exists(soFile))
+        self.assertEqual(sorted(x for x in os.listdir(self.buildDir) if not x.startswith("toolchain-")), sorted(["obj", os.path.basename(soFile)]))
+        objList = os.listdir(os.path.join(self.buildDir, "obj"))
+        self.assertEqual(len(objList), len(pylkc.api._src_files) + len(pylkc.api._gen_src_files) + 1)
+
+        # only the changed translation unit is compiled again
+        with open(os.path.join(self.kcfgDir, "util.c"), "a") as f:
+            f.write("int pylkc_test_changed(void) { return 0; }\n")
+        key2 = pylkc.api._get_build_key(self.kcfgDir, self.buildDir)
+        self.assertNotEqual(key2, key)
+        pylkc.api._build_so_file(self.kcfgDir, self.buildDir, os.path.join(self.buildDir, "%s.so" % (key2)))
+        newObjList = os.listdir(os.path.join(self.buildDir, "obj"))
+        self.assertEqual(len(newObjList), len(objList) + 1)
+        self.assertTrue(set(objList) <= set(newObjList))
+
+    def tearDown(self):
+        pylkc.api._helper_src_file = self.helperSrcFile
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+
+class Test_AtomicOutput(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = os.path.join(curDir, "tmp")
+        os.makedirs(self.tmpDir, exist_ok=True)
+
+    def runTest(self):
+        # a failed command leaves neither the output file nor the temporary file
+        outFile = os.path.join(self.tmpDir, "out.o")
+        with self.assertRaises(subprocess.CalledProcessError):
+            pylkc.api._check_call_to_file(["sh", "-c", "echo partial > \"$0\"; false"], outFile)
+        self.assertEqual(os.listdir(self.tmpDir), [])
+
+        pylkc.api._check_call_to_file(["sh", "-c", "echo done > \"$0\""], outFile)
+        self.assertEqual(os.listdir(self.tmpDir), ["out.o"])
+        with open(outFile) as f:
+            self.assertEqual(f.read(), "done\n")
+
+        cacheFile = os.path.join(self.tmpDir, "sub", "a.json")
+        pylkc.api.write_cache_file(cacheFile, {"a": [1, 2]})
+        self.assertEqual(pylkc.api.read_cache_file(cacheFile), {"a": [1, 2]})
+        self.assertEqual(os.listdir(os.path.dirname(cacheFile)), ["a.json"])
+        self.assertIsNone(pylkc.api.read_cache_file(os.path.join(self.tmpDir, "none.json")))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+
+class Test_BuildDir(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.buildDir = os.path.join(curDir, "build")
+
+    def runTest(self):
+        # the shared object lands in build_dir, a second load doesn't build it again
+        pylkc.init(self.rootDir, build_dir=self.buildDir)
+        pylkc.release()
+        soList = [x for x in os.listdir(self.buildDir) if x.endswith(".so")]
+        self.assertEqual(len(soList), 1)
+        mtime = os.stat(os.path.join(self.buildDir, soList[0])).st_mtime_ns
+
+        pylkc.init(self.rootDir, build_dir=self.buildDir)
+        pylkc.release()
+        self.assertEqual([x for x in os.listdir(self.buildDir) if x.endswith(".so")], soList)
+        self.assertEqual(os.stat(os.path.join(self.buildDir, soList[0])).st_mtime_ns, mtime)
+
+    def tearDown(self):
+        shutil.rmtree(self.buildDir, ignore_errors=True)
+
+
+class Test_TagTable(unittest.TestCase):
+    def setUp(self):
+        with open("tags.txt", "w") as f:
+            f.write("# site list\nworkaround name SITE_QUIRK\ndebugging name-pattern ^SITE_TEST_\n")
+        with open("tags.json", "w") as f:
+            f.write("{\"dangerous\": {\"prompt-patterns\": [\"site only\"]}}")
+
+    def runTest(self):
+        digest = pylkcx.get_tag_table_digest()
+        try:
+            pylkcx.load_tag_table("tags.txt")
+            pylkcx.load_tag_table("tags.json")
+            self.assertNotEqual(pylkcx.get_tag_table_digest(), digest)
+            tagTable = {x[0]: x for x in pylkcx._tag_table}
+            self.assertIn("SITE_QUIRK", tagTable[pylkcx.TAG_WORKAROUND][3])
+            self.assertIsNotNone(tagTable[pylkcx.TAG_DEBUGGING][1].search("SITE_TEST_A"))
+            self.assertIsNotNone(tagTable[pylkcx.TAG_DEBUGGING][1].search("USB_DEBUG"))
+            self.assertIsNotNone(tagTable[pylkcx.TAG_DANGEROUS][2].search("For Site Only"))
+
+            pylkcx.load_tag_table("tags.json", replace=True)
+            self.assertEqual([x[0] for x in pylkcx._tag_table], [pylkcx.TAG_DANGEROUS])
+        finally:
+            pylkcx.reset_tag_table()
+        self.assertEqual(pylkcx.get_tag_table_digest(), digest)
+
+    def tearDown(self):
+        os.remove("tags.txt")
+        os.remove("tags.json")
+
+
+class Test_MenuTree(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            menuList = []
+            self._walk(pylkc.rootmenu, menuList)
+            self.assertEqual(pylkc.all_menus(), menuList)
+            self.assertEqual(pylkc.menu_subtree(pylkc.rootmenu), menuList)
+
+            m = pylkc.menu_find_by_path("/General setup")
+            subList = []
+            self._walk(m, subList)
+            self.assertEqual(pylkc.menu_subtree(m), subList)
+        finally:
+            pylkc.release()
+
+    def _walk(self, menuObj, menuList):
+        menuList.append(menuObj)
+        p = menuObj.c_menu_p.contents.list
+        while p:
+            self._walk(pylkc.menu(p), menuList)
+            p = p.contents.next
+
+
+class Test_MenuPath(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            m = pylkc.menu_find_by_path("/General setup/Kernel compression mode")
+            self.assertIsNotNone(m)
+            self.assertTrue(m.sym.is_choice())
+            self.assertEqual(pylkc.menu_get_path(m), "/General setup/Kernel compression mode")
+            self.assertIs(pylkc.menu_find_by_path("/general setup/kernel compression mode", True), m)
+            self.assertIsNone(pylkc.menu_find_by_path("/general setup/kernel compression mode"))
+
+            for m in pylkc.all_menus():
+                p = pylkc.menu_get_path(m)
+                if p is not None:
+                    self.assertEqual(pylkc.menu_get_path(pylkc.menu_find_by_path(p)), p)
+        finally:
+            pylkc.release()
+
+
+class Test_Interning(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            sym = pylkc.sym_find("MODULES")
+            self.assertIs(pylkc.sym_find("MODULES"), sym)
+            self.assertIs(pylkc.menu_find_by_sym(sym).sym, sym)
+            self.assertIs(sym.rev_dep, sym.rev_dep)
+            self.assertIsNot(sym.rev_dep, sym.dir_dep)
+            self.assertIs(pylkc.rootmenu.list[0], pylkc.rootmenu.list[0])
+            self.assertIs(pylkc.rootmenu.list[0].get_parent_menu(), pylkc.rootmenu)
+            for p in sym.get_properties():
+                self.assertIs(p.expr, p.expr)
+        finally:
+            pylkc.release()
+
+
+class Test_MenuTags(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            tagArray = pylkcx.get_all_menu_tags()
+            self.assertIs(pylkcx.get_all_menu_tags(), tagArray)
+            self.assertEqual(len(tagArray), len(pylkc.all_menus()))
+            for i, m in enumerate(pylkc.all_menus()):
+                self.assertEqual(pylkc.menu_id(m), i)
+                if m.sym is None or m.sym.name is None or m.prompt is None:
+                    self.assertEqual(tagArray[i], 0)
+
+            m = pylkc.menu_find_by_sym(pylkc.sym_find("DEBUG_KERNEL"))
+            self.assertTrue(pylkcx.is_menu_debugging(m))
+            self.assertFalse(pylkcx.is_menu_deprecated(m))
+            m = pylkc.menu_find_by_sym(pylkc.sym_find("STAGING"))
+            self.assertEqual(pylkcx.get_menu_tags(m), pylkcx.TAG_EXPERIMENTAL)
+        finally:
+            pylkc.release()
+
+
+class Test_SymbolSearch(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            symList = pylkc.all_symbols()
+            self.assertIs(pylkc.sym_find("MODULES"), symList[pylkc.sym_id(pylkc.sym_find("MODULES"))])
+            self.assertIsNone(pylkc.sym_find("NO_SUCH_SYMBOL_ABC"))
+
+            ret = [symList[i].name for i in pylkc.sym_search_prefix("SQUASHFS")]
+            self.assertIn("SQUASHFS", ret)
+            self.assertIn("SQUASHFS_XZ", ret)
+            self.assertTrue(all(x.startswith("SQUASHFS") for x in ret))
+            self.assertEqual(pylkc.sym_search_glob("SQUASHFS*"), pylkc.sym_search_prefix("SQUASHFS"))
+            self.assertEqual(pylkc.sym_search_regex("SQUASHFS"), pylkc.sym_search_prefix("SQUASHFS"))
+            self.assertEqual([symList[i].name for i in pylkc.sym_search_glob("SQUASHFS_?Z")], ["SQUASHFS_XZ"])
+        finally:
+            pylkc.release()
+
+
+class Test_ExprTree(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            util.value_refresh()
+
+            triValues = pylkc.read_values().tri
+            strValues = [x.get_string_value() for x in pylkc.all_symbols()]
+            for sym in pylkc.all_symbols():
+                exprList = [sym.dir_dep.expr, sym.rev_dep.expr]
+                exprList += [x.expr for x in sym.get_properties(pylkc.property.TYPE_DEFAULT)]
+                for e in exprList:
+                    if e is None or e.type == pylkc.expr.TYPE_NONE:
+                        continue
+                    node = pylkcx.exprtree.compile_expr(e)
+                    self.assertIs(pylkcx.exprtree.compile_expr(e), node)
+                    self.assertEqual(pylkcx.exprtree.lower(node)(triValues, strValues), e.calc_value())
+        finally:
+            pylkc.release()
+
+
+class Test_Graph(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+
+            g = pylkcx.graph.get_graph()
+            self.assertIs(pylkcx.graph.get_graph(), g)
+            self.assertEqual(sorted(g.topological_order()), list(range(0, len(pylkc.all_symbols()))))
+            for i in range(0, g.node_count):
+                for j in g.successors(i):
+                    self.assertIn(i, g.predecessors(j))
+                    self.assertLessEqual(g.scc_index[i], g.scc_index[j])
+
+            # MODULES selects nothing, but a lot of symbols depend on it
+            sym = pylkc.sym_find("MODULES")
+            ret = g.forward_closure([pylkc.sym_id(sym)])
+            self.assertIn(pylkc.sym_id(pylkc.sym_find("MODULE_UNLOAD")), ret)
+            self.assertIn(pylkc.sym_id(sym), g.reverse_closure([pylkc.sym_id(pylkc.sym_find("MODULE_UNLOAD"))]))
+
+            g2 = pylkcx.graph.get_graph(pylkcx.graph.EDGE_SELECT)
+            for i, s in enumerate(pylkc.all_symbols()):
+                selList = [pylkc.sym_id(x.get_symbol()) for x in s.get_properties(pylkc.property.TYPE_SELECT)]
+                self.assertEqual(list(g2.successors(i)), sorted(set(selList) - set([i])))
+        finally:
+            pylkc.release()
+
+
+class Test_Fingerprint(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.cacheDir = os.path.join(curDir, "cache")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            fileList = pylkc.parsed_files()
+            fingerprint = pylkcx.fingerprint.get_fingerprint(self.cacheDir)
+        finally:
+            pylkc.release()
+
+        # the second call finds all the files in the manifest
+        self.assertEqual(pylkcx.fingerprint.compute_fingerprint(self.rootDir, fileList, self.cacheDir), fingerprint)
+        self.assertEqual(pylkcx.fingerprint.compute_fingerprint(self.rootDir, fileList, self.cacheDir), fingerprint)
+        self.assertNotEqual(pylkcx.fingerprint.compute_fingerprint(self.rootDir, fileList[:-1], self.cacheDir), fingerprint)
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+class Test_ConfigDiff(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            pylkc.calc_all()
+            old = pylkcx.diff.read_current()
+            self.assertEqual(pylkcx.diff.diff(old, old), [])
+            strList = pylkc.read_string_values()
+            self.assertEqual(len(strList), len(pylkc.all_symbols()))
+            self.assertEqual(strList[pylkc.sym_id(pylkc.sym_find("DEFAULT_HOSTNAME"))], "(none)")
+            self.assertEqual(strList[pylkc.sym_id(pylkc.sym_find("MODULES"))], "")
+
+            sym = pylkc.sym_find("MODULES")
+            sym.set_tristate_value(pylkc.tristate.yes)
+            new = pylkcx.diff.read_current()
+            self.assertEqual(new.get_value(pylkc.sym_id(sym)), "y")
+            self.assertEqual(new.get_origin(pylkc.sym_id(sym)), pylkcx.diff.ORIGIN_USER)
+
+            changeDict = dict()
+            for menuPath, changeList in pylkcx.diff.diff(old, new, origin_changes=True):
+                for c in changeList:
+                    changeDict[c.name] = (menuPath, c)
+            self.assertIn("MODULES", changeDict)
+            self.assertEqual(changeDict["MODULES"][1].new_value, "y")
+            self.assertEqual(changeDict["MODULES"][1].new_origin, pylkcx.diff.ORIGIN_USER)
+        finally:
+            pylkc.release()
+
+
+class Test_ConfWriteMin(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.tmpDir = os.path.join(curDir, "tmp")
+        os.makedirs(self.tmpDir, exist_ok=True)
+
+    def runTest(self):
+        fullFile = os.path.join(self.tmpDir, "config.full")
+        minFile = os.path.join(self.tmpDir, "config.min")
+        expandedFile = os.path.join(self.tmpDir, "config.expanded")
+
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            pylkc.calc_all()
+            pylkc.sym_find("MODULES").set_tristate_value(pylkc.tristate.yes)
+            pylkc.calc_all()
+            pylkc.conf_write(fullFile)
+            pylkc.conf_write_min(minFile)
+            self.assertRaises(OSError, pylkc.conf_write_min, os.path.join(self.tmpDir, "none", "config.min"))
+        finally:
+            pylkc.release()
+
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_expand_min(minFile, expandedFile)
+        finally:
+            pylkc.release()
+
+        with open(minFile) as f:
+            self.assertIn("CONFIG_MODULES=y", f.read().split("\n"))
+        with open(fullFile, "rb") as f1, open(expandedFile, "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+
+class Test_ConfBytes(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            pylkc.calc_all()
+            pylkc.sym_find("MODULES").set_tristate_value(pylkc.tristate.yes)
+            pylkc.calc_all()
+            buf = pylkc.conf_write_bytes()
+        finally:
+            pylkc.release()
+        self.assertIn(b"CONFIG_MODULES=y", buf.split(b"\n"))
+
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read_bytes(buf)
+            pylkc.calc_all()
+            self.assertEqual(pylkc.sym_find("MODULES").get_tristate_value(), pylkc.tristate.yes)
+            self.assertEqual(pylkc.conf_write_bytes(), buf)
+        finally:
+            pylkc.release()
+
+
+class Test_CalcAll(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            self.assertEqual(pylkc.calc_all(), len(pylkc.all_symbols()))
+            self.assertEqual(pylkc.calc_all(only_invalid=True), 0)
+
+            sym = pylkc.sym_find("MODULES")
+            ret = sym.set_tristate_value(pylkc.tristate.yes)       # invalidates all the symbols
+            self.assertTrue(ret)
+            self.assertGreater(pylkc.calc_all(only_invalid=True), 0)
+            self.assertEqual(pylkc.calc_all(only_invalid=True), 0)
+            self.assertEqual(sym.get_tristate_value(), pylkc.tristate.yes)
+        finally:
+            pylkc.release()
+
+
+class Test_ReadValues(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            pylkc.conf_read(None)
+            util.value_refresh()
+
+            values1 = pylkc.read_values()
+            self.assertEqual(len(values1), len(pylkc.all_symbols()))
+            for i, sym in enumerate(pylkc.all_symbols()):
+                self.assertEqual(pylkc.sym_id(sym), i)
+                self.assertEqual(values1.type[i], sym.get_type())
+                self.assertEqual(values1.tri[i], sym.get_tristate_value())
+                self.assertEqual(values1.visible[i], sym.visible)
+                self.assertEqual(values1.rev_dep_tri[i], sym.rev_dep.tri)
+
+            sym = pylkc.sym_find("MODULES")
+            ret = sym.set_tristate_value(pylkc.tristate.yes)
+            self.assertTrue(ret)
+            util.value_refresh()
+            values2 = pylkc.read_values()
+            self.assertIn(pylkc.sym_id(sym), values1.changed_ids(values2))
+            self.assertEqual(values2.changed_ids(values2), [])
+        finally:
+            pylkc.release()
+
+
+class Test_Pool(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        with open(".config", "w") as f:
+            pass
+
+    def runTest(self):
+        with pylkcutil.pool.Pool(self.rootDir, 2) as p:
+            r1 = p.check_values_async(".config", {"DEFAULT_HOSTNAME": "(none)", "MODULES": "n"})
+            r2 = p.check_values_async(".config", {"MODULES": "y"})
+            r1.get()
+            with self.assertRaises(pylkcutil.checker.CheckError) as cm:
+                r2.get()
+            self.assertEqual(cm.exception.name, "MODULES")
+            self.assertEqual(cm.exception.realValue, "n")
+
+            # the parsed tree in this process is never modified by the jobs
+            self.assertEqual(pylkc.sym_find("MODULES").get_tristate_value(), pylkc.tristate.no)
+
+    def tearDown(self):
+        os.remove(".config")
+
+
+class Test_PropagateSymRef(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        with open("rules.txt", "w") as f:
+            f.write("MODULES=y\n[normal-symbols:/File systems]=m")
+
+    def runTest(self):
+        recorder1 = pylkcutil.generator.EventRecorder()
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config1", eventHandler=recorder1)
+
+        # baseline: every symbol except the ones just set is re-calculated until suppression changes nothing
+        def _fullPropagateSymRef(context, name, symList):
+            allSymList = pylkc.all_symbols()
+            graph = context.symRefGraph
+            skipSet = set(pylkc.sym_id(x) for x in symList)
+            idList = sorted((x for x in range(0, len(allSymList)) if x not in skipSet), key=lambda x: (graph.scc_index[x], x))
+            recalcCount = 0
+            change = 1
+            while change > 0:
+                change = 0
+                for i in idList:
+                    change += pylkcutil.generator._calcAndSuppressSymRef(context, allSymList[i])[0]
+                    recalcCount += 1
+            context.eventHandler.valuePropagated(name, recalcCount)
+
+        recorder2 = pylkcutil.generator.EventRecorder()
+        propagateSymRef = pylkcutil.generator._propagateSymRef
+        pylkcutil.generator._propagateSymRef = _fullPropagateSymRef
+        try:
+            pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config2", eventHandler=recorder2)
+        finally:
+            pylkcutil.generator._propagateSymRef = propagateSymRef
+
+        with open("config1") as f1, open("config2") as f2:
+            self.assertEqual(f1.read(), f2.read())
+        count1 = sum(x[1][1] for x in recorder1.eventList if x[0] == "valuePropagated")
+        count2 = sum(x[1][1] for x in recorder2.eventList if x[0] == "valuePropagated")
+        self.assertGreater(count1, 0)
+        self.assertLess(count1, count2)
+
+    def tearDown(self):
+        for fn in ["config1", "config2", "rules.txt"]:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+
+class Test_AllNoConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.cacheDir = os.path.join(curDir, "cache")
+        with open("rules.txt", "w") as f:
+            f.write("DEFAULT_HOSTNAME=\"(none)\"")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            fileList = pylkc.parsed_files()
+            self.assertEqual(fileList[0], os.path.join(self.rootDir, "Kconfig"))
+            self.assertIn(os.path.join(self.rootDir, "init", "Kconfig"), fileList)
+        finally:
+            pylkc.release()
+
+        # the second run saves the base state, the third run replays it
+        # Pool doesn't use the result cache, so the third run doesn't return the saved result of the second run
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config1")
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config2", cacheDir=self.cacheDir)
+        self.assertEqual(len([x for x in os.listdir(self.cacheDir) if x.startswith("allnoconfig-")]), 1)
+        with pylkcutil.pool.Pool(self.rootDir, 1) as p:
+            p.generate("allnoconfig", "rules.txt", output="config3", cacheDir=self.cacheDir)
+        self.assertEqual(len([x for x in os.listdir(self.cacheDir) if x.startswith("allnoconfig-")]), 1)
+        for fn in ["config2", "config3"]:
+            with open("config1") as f1, open(fn) as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def tearDown(self):
+        for fn in ["config1", "config2", "config3", "rules.txt"]:
+            if os.path.exists(fn):
+                os.remove(fn)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+class Test_CacheWithoutFileList(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.cacheDir = os.path.join(curDir, "cache")
+        with open("rules.txt", "w") as f:
+            f.write("DEFAULT_HOSTNAME=\"(none)\"")
+
+    def runTest(self):
+        pylkc.init(self.rootDir)
+        try:
+            pylkc.conf_parse(self.rootDir)
+            fileList = pylkc.api.library.g_file_list
+            pylkc.api.library.g_file_list = None            # same as a kernel without file_list
+            try:
+                self.assertRaises(pylkc.VersionError, pylkc.parsed_files)
+                context = pylkcutil.generator._Context()
+                context.eventHandler = pylkcutil.generator.EventRecorder()
+                pylkcutil.generator._generate(context, self.rootDir, "allnoconfig", "rules.txt", None, "config1", self.cacheDir)
+                self.assertEqual([x[0] for x in context.eventHandler.eventList].count("cacheDisabled"), 1)
+            finally:
+                pylkc.api.library.g_file_list = fileList
+        finally:
+            pylkc.release()
+        self.assertTrue(os.path.exists("config1"))
+        self.assertFalse(os.path.exists(self.cacheDir))
+
+    def tearDown(self):
+        for fn in ["config1", "rules.txt"]:
+            if os.path.exists(fn):
+                os.remove(fn)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+class Test_ResultCache(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.cacheDir = os.path.join(curDir, "cache")
+        with open("rules.txt", "w") as f:
+            f.write("DEFAULT_HOSTNAME=\"(none)\"\nMODULES=y")
+
+    def runTest(self):
+        recorder1 = pylkcutil.generator.EventRecorder()
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config1", eventHandler=recorder1, cacheDir=self.cacheDir)
+        recorder2 = pylkcutil.generator.EventRecorder()
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config2", eventHandler=recorder2, cacheDir=self.cacheDir)
+        self.assertEqual([(x[0], list(x[1])) for x in recorder1.eventList], [(x[0], list(x[1])) for x in recorder2.eventList])
+        with open("config1") as f1, open("config2") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+        # comments are not a part of the key
+        with open("rules.txt", "a") as f:
+            f.write("\n# comment")
+        fileList = os.listdir(self.cacheDir)
+        pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config2", cacheDir=self.cacheDir)
+        self.assertEqual(sorted(os.listdir(self.cacheDir)), sorted(fileList))
+
+        # different base config files don't share the result
+        with open("base1", "w") as f:
+            f.write("CONFIG_LOCALVERSION=\"-base1\"\n")
+        with open("base2", "w") as f:
+            f.write("CONFIG_LOCALVERSION=\"-base2\"\n")
+        pylkcutil.generator.generate(self.rootDir, "file", "rules.txt", baseConfigFilename="base1", output="config1", cacheDir=self.cacheDir)
+        pylkcutil.generator.generate(self.rootDir, "file", "rules.txt", baseConfigFilename="base2", output="config2", cacheDir=self.cacheDir)
+        with open("config1") as f1, open("config2") as f2:
+            self.assertIn("CONFIG_LOCALVERSION=\"-base1\"", f1.read().split("\n"))
+            self.assertIn("CONFIG_LOCALVERSION=\"-base2\"", f2.read().split("\n"))
+
+        # a changed classifier table invalidates the results
+        with open("tags.txt", "w") as f:
+            f.write("workaround name SITE_QUIRK\n")
+        fileList = [x for x in os.listdir(self.cacheDir) if x.startswith("result-")]
+        pylkcx.load_tag_table("tags.txt")
+        try:
+            pylkcutil.generator.generate(self.rootDir, "allnoconfig", "rules.txt", output="config2", cacheDir=self.cacheDir)
+        finally:
+            pylkcx.reset_tag_table()
+        self.assertEqual(len([x for x in os.listdir(self.cacheDir) if x.startswith("result-")]), len(fileList) + 1)
+
+    def tearDown(self):
+        for fn in ["config1", "config2", "base1", "base2", "tags.txt", "rules.txt"]:
+            if os.path.exists(fn):
+                os.remove(fn)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+class Test_CompiledRules(unittest.TestCase):
+    def setUp(self):
+        self.rootDir = os.path.join(curDir, "linux-5.1.15")
+        self.cacheDir = os.path.join(curDir, "cache")
+        with open("rules.txt", "w") as f:
+            f.write("MODULES=y\n[normal-symbols:/File systems]=m\n[regex-symbols:\\bISCSI\\b:/Device Drivers]=n")
+
+    def runTest(self):
+        # Pool doesn't use the result cache, so the second job loads the compiled rules
+        with pylkcutil.pool.Pool(self.rootDir, 1) as p:
+            p.generate("allnoconfig+module", "rules.txt", output="config1", cacheDir=self.cacheDir)
+            self.assertEqual(len([x for x in os.listdir(self.cacheDir) if x.startswith("rules-")]), 1)
+            p.generate("allnoconfig+module", "rules.txt", output="config2", cacheDir=self.cacheDir)
+            self.assertEqual(len([x for x in os.listdir(self.cacheDir) if x.startswith("rules-")]), 1)
+        with open("config1") as f1, open("config2") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def tearDown(self):
+        for fn in ["config1", "config2", "rules.txt"]:
+            if os.path.exists(fn):
+                os.remove(fn)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
 class Test_Generate(unittest.TestCase):
     def setUp(self):
         self.rootDir = os.path.join(curDir, "linux-4.0")
@@ -751,27 +1577,43 @@ def suite():
     suite.addTest(Test_Path_5())
     suite.addTest(Test_Path_6())
     suite.addTest(Test_Path_7())
-
-    # error when reading one directory twice, so do a random test
-    r = random.randint(1, 7)
-    if r == 1:
-        suite.addTest(Test_Linux_3_16())
-    elif r == 2:
-        suite.addTest(Test_Linux_3_17())
-    elif r == 3:
-        suite.addTest(Test_Linux_3_18())
-    elif r == 4:
-        suite.addTest(Test_Linux_4_0())
-    elif r == 5:
-        suite.addTest(Test_Linux_4_2())
-    elif r == 6:
-        suite.addTest(Test_Linux_5_0_7())
-    elif r == 7:
-        suite.addTest(Test_Linux_5_1_15())
-    elif r == 8:
-        suite.addTest(Test_Menu_Structure())
-    else:
-        assert False
+    suite.addTest(Test_TagTable())
+    suite.addTest(Test_RunQueue())
+    suite.addTest(Test_BuildCache())
+    suite.addTest(Test_AtomicOutput())
+
+    # every pylkc.init() loads its own copy of the library, so all the kernel versions can be tested in one process
+    suite.addTest(Test_Linux_3_16())
+    suite.addTest(Test_Linux_3_17())
+    suite.addTest(Test_Linux_3_18())
+    suite.addTest(Test_Linux_4_0())
+    suite.addTest(Test_Linux_4_2())
+    suite.addTest(Test_Linux_5_0_7())
+    suite.addTest(Test_Linux_5_1_15())
+    suite.addTest(Test_Menu_Structure())
+    suite.addTest(Test_Session())
+    suite.addTest(Test_LibraryUnload())
+    suite.addTest(Test_BuildDir())
+    suite.addTest(Test_Snapshot())
+    suite.addTest(Test_Interning())
+    suite.addTest(Test_MenuTree())
+    suite.addTest(Test_MenuPath())
+    suite.addTest(Test_MenuTags())
+    suite.addTest(Test_SymbolSearch())
+    suite.addTest(Test_CalcAll())
+    suite.addTest(Test_ExprTree())
+    suite.addTest(Test_Graph())
+    suite.addTest(Test_Fingerprint())
+    suite.addTest(Test_ConfigDiff())
+    suite.addTest(Test_ConfWriteMin())
+    suite.addTest(Test_ConfBytes())
+    suite.addTest(Test_ReadValues())
+    suite.addTest(Test_Pool())
+    suite.addTest(Test_PropagateSymRef())
+    suite.addTest(Test_AllNoConfigCache())
+    suite.addTest(Test_CacheWithoutFileList())
+    suite.addTest(Test_ResultCache())
+    suite.addTest(Test_CompiledRules())
 
 #    suite.addTest(Test_Generate())
 #    suite.addTest(Test_CheckValue())